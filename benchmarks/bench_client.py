@@ -0,0 +1,189 @@
+# coding: utf-8
+"""Throughput, tail latency and memory of ``EnsimeClient`` against the stand-in server.
+
+Run from the repository root, with the Python of Sublime Text (3.3) or any
+release up to 3.6, as the plugin uses ``async`` as an identifier::
+
+    python benchmarks/bench_client.py [--engine threads|asyncio] [--latency SECONDS]
+                                      [--size N] [--calls N] [--concurrency N]
+                                      [--storm EVENTS NOTES]
+
+The real client and protocol handlers run outside of the editor: the
+``sublime`` API, which only exists inside Sublime Text, is replaced by a
+``unittest.mock`` module and the editor by a mock recording the calls.
+
+Scenarios:
+
+* ``latency``: sequential synchronous ``CompletionsReq`` round trips,
+  handled by ``handle_completion_info_list``;
+* ``throughput``: ``TypeCheckFilesReq`` futures, ``--concurrency`` submitted
+  at a time, of which the scheduler sends ``max_background_requests``;
+* ``storm``: a full typecheck's worth of ``NewScalaNotesEvent`` pushed by the
+  server, until ``FullTypeCheckCompleteEvent`` has been handled.
+
+Each reports the peak memory allocated while it ran (``tracemalloc``).
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from unittest import mock
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path += [os.path.join(root, "dependencies"),
+             os.path.join(root, "ensimesublime"),
+             os.path.dirname(os.path.abspath(__file__))]
+
+try:
+    import sublime  # noqa: F401
+except ImportError:
+    sublime = mock.MagicMock(name="sublime")
+    # drop UI callbacks, a mock would keep them and their payloads alive
+    sublime.set_timeout = lambda callback, delay=0: None
+    sys.modules["sublime"] = sublime
+
+from client import EnsimeClient  # noqa: E402
+from metrics import Histogram  # noqa: E402
+from notes import NotesStorage  # noqa: E402
+from outgoing import CompletionsReq, TypeCheckFilesReq  # noqa: E402
+from standin import StandInServer  # noqa: E402
+
+
+class StandInProcess(object):
+    """What the client needs of an ``EnsimeProcess``, for the stand-in server."""
+
+    def __init__(self, server):
+        self.server = server
+
+    def is_running(self):
+        return True
+
+    def http_port(self):
+        return self.server.port
+
+    def stop(self):
+        pass
+
+
+class BenchEnvironment(object):
+    """What the client and its handlers need of an ``_EnsimeEnvironment``."""
+
+    def __init__(self, engine):
+        self.settings = {"transport_engine": engine, "heartbeat_interval": 0}
+        self.logger = logging.getLogger("bench")
+        self.logger.setLevel(logging.WARNING)
+        self.window = mock.MagicMock(name="window")
+        self.editor = mock.MagicMock(name="editor", current_prefix=None, ignore_prefix=None)
+        self.notes_storage = NotesStorage()
+        self.cache_dir = tempfile.mkdtemp(prefix="ensime-bench-")
+        self.project_root = "/home/user/project"
+        self.client = None
+
+    def status_message(self, msg):
+        pass
+
+    def error_message(self, msg):
+        self.logger.error(msg)
+
+
+def connect(env, server):
+    client = EnsimeClient(env, None)
+    env.client = client
+    client.ensime = StandInProcess(server)
+    client.connect_when_ready(5, lambda: None)
+    if not client.connected:
+        raise RuntimeError("couldn't connect to the stand-in server")
+    return client
+
+
+def measure(name, scenario):
+    tracemalloc.start()
+    try:
+        summary = scenario()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    print("{:<11} {}  peak={:7.1f}MB".format(name, summary, peak / 1024.0 / 1024.0))
+
+
+def latency(env, calls, size):
+    histogram = Histogram()
+    for _ in range(calls):
+        start = time.time()
+        if CompletionsReq(10, "/src/Foo.scala", max_results=size).run_in(env) is None:
+            raise RuntimeError("no completions from the stand-in server")
+        histogram.record(time.time() - start)
+    return "n={:<6} p50={:8.3f}ms p95={:8.3f}ms p99={:8.3f}ms max={:8.3f}ms".format(
+        histogram.count, histogram.percentile(50) * 1000, histogram.percentile(95) * 1000,
+        histogram.percentile(99) * 1000, histogram.max / 1000.0)
+
+
+def throughput(env, calls, concurrency):
+    slots = threading.BoundedSemaphore(concurrency)
+    done = threading.Event()
+    completed = [0]
+    lock = threading.Lock()
+
+    def release(response):
+        slots.release()
+        with lock:
+            completed[0] += 1
+            if completed[0] == calls:
+                done.set()
+
+    start = time.time()
+    for _ in range(calls):
+        slots.acquire()
+        TypeCheckFilesReq(["/src/A.scala"]).run_in(env, future=True).add_done_callback(release)
+    done.wait(60)
+    elapsed = time.time() - start
+    return "n={:<6} {:9.1f} req/s  in flight={}".format(completed[0], completed[0] / elapsed,
+                                                       concurrency)
+
+
+def storm(env, server, events, notes_per_event):
+    complete = threading.Event()
+    env.editor.request_redraw_changed.side_effect = lambda *args: complete.set()
+    start = time.time()
+    server.notes_storm(events, notes_per_event)
+    if not complete.wait(60):
+        raise RuntimeError("FullTypeCheckCompleteEvent wasn't handled")
+    elapsed = time.time() - start
+    stored = sum(len(notes) for notes in env.notes_storage.per_file_cache.values())
+    return "n={:<6} {:9.1f} notes/s  {:.3f}s".format(stored, stored / elapsed, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", default="threads", choices=["threads", "asyncio"])
+    parser.add_argument("--latency", type=float, default=0.002,
+                        help="simulated server processing time in seconds")
+    parser.add_argument("--size", type=int, default=100,
+                        help="entries in completion and symbol search responses")
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--storm", type=int, nargs=2, default=[200, 100],
+                        metavar=("EVENTS", "NOTES"))
+    args = parser.parse_args()
+
+    server = StandInServer(latency=args.latency, payload_size=args.size).start()
+    env = BenchEnvironment(args.engine)
+    client = connect(env, server)
+    try:
+        measure("latency", lambda: latency(env, args.calls, args.size))
+        measure("throughput", lambda: throughput(env, args.calls, args.concurrency))
+        measure("storm", lambda: storm(env, server, *args.storm))
+        print("transport   {}".format(client.transport.stats()))
+        print("scheduler   {}".format(client.scheduler.stats()))
+    finally:
+        client.teardown()
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
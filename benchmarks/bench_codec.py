@@ -0,0 +1,68 @@
+# coding: utf-8
+"""Encoding and decoding cost of large messages: stdlib defaults vs. ``codec``.
+
+Run from the repository root::
+
+    python benchmarks/bench_codec.py [--entries N] [--repeat N]
+
+Decodes large ``CompletionInfoList`` and ``SymbolSearchResults`` responses
+with ``json.loads`` and ``codec.loads``, and measures how cheaply ``codec.peek``
+recognises a response to drop. Encodes a ``CompletionsReq`` carrying a buffer
+with non-ASCII source with ``json.dumps`` defaults and ``codec.dumps``.
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path += [os.path.join(root, "ensimesublime"),
+             os.path.dirname(os.path.abspath(__file__))]
+
+import codec  # noqa: E402
+import standin  # noqa: E402
+
+
+def completions_req(lines):
+    contents = "\n".join("  val größe{} = \"héllo wörld → λ\" // ✓".format(i) for i in range(lines))
+    return {"callId": 9, "req": {"typehint": "CompletionsReq",
+                                 "fileInfo": {"file": "/src/Größe.scala", "contents": contents},
+                                 "point": 100, "maxResults": 100, "caseSens": True,
+                                 "reload": False}}
+
+
+def best(fn, repeat):
+    return min(timeit.repeat(fn, number=1, repeat=repeat)) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    print("codec backend: {}".format(codec.NAME))
+    for call_id, builder in enumerate((standin.completion_info_list,
+                                       standin.symbol_search_results)):
+        payload = builder({}, args.entries)
+        name = payload["typehint"]
+        frame = json.dumps({"callId": call_id, "payload": payload})
+        print("{:<20} {:>9} bytes  json.loads={:8.2f}ms  codec.loads={:8.2f}ms  codec.peek={:8.4f}ms"
+              .format(name, len(frame),
+                      best(lambda: json.loads(frame), args.repeat),
+                      best(lambda: codec.loads(frame), args.repeat),
+                      best(lambda: codec.peek(frame), args.repeat)))
+
+    request = completions_req(args.entries)
+    stdlib = json.dumps(request)
+    compact = codec.dumps(request)
+    print("{:<20} json.dumps={:8.2f}ms {:>9} bytes  codec.dumps={:8.2f}ms {:>9} bytes"
+          .format("CompletionsReq",
+                  best(lambda: json.dumps(request), args.repeat), len(stdlib.encode("utf-8")),
+                  best(lambda: codec.dumps(request), args.repeat), len(compact.encode("utf-8"))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# coding: utf-8
+"""Websocket frame masking: per-byte loop vs. the wide integer xor of ``ABNF.mask``.
+
+Run from the repository root::
+
+    python benchmarks/bench_mask.py [--repeat N]
+
+Every frame the client sends is masked, so requests carrying a whole buffer
+pay this cost on each keystroke-triggered send. The ``bytewise`` column is
+the loop the vendored websocket client used when ``wsaccel`` is missing,
+which is always the case inside Sublime Text.
+"""
+
+import argparse
+import array
+import os
+import sys
+import timeit
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path += [os.path.join(root, "dependencies")]
+
+from websocket import ABNF  # noqa: E402
+
+SIZES = [1 << 10, 10 << 10, 100 << 10, 1 << 20, 10 << 20]
+
+
+def bytewise(mask_key, data):
+    _m = array.array("B", mask_key)
+    _d = array.array("B", data)
+    for i in range(len(_d)):
+        _d[i] ^= _m[i % 4]
+    return _d.tobytes()
+
+
+def best(fn, repeat):
+    return min(timeit.repeat(fn, number=1, repeat=repeat)) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    mask_key = os.urandom(4)
+    for size in SIZES:
+        data = os.urandom(size)
+        assert ABNF.mask(mask_key, data) == bytewise(mask_key, data)
+        slow = best(lambda: bytewise(mask_key, data), 1 if size > (1 << 20) else args.repeat)
+        fast = best(lambda: ABNF.mask(mask_key, data), args.repeat)
+        print("{:>9} bytes  bytewise={:10.3f}ms  ABNF.mask={:8.3f}ms  speedup={:7.1f}x"
+              .format(size, slow, fast, slow / fast))
+
+
+if __name__ == "__main__":
+    main()
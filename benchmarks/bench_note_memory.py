@@ -0,0 +1,79 @@
+# coding: utf-8
+"""Memory kept per note: a plain object per note vs. the compact ``Note``.
+
+Run from the repository root::
+
+    python benchmarks/bench_note_memory.py [--notes N] [--files N]
+
+Decodes ``NewScalaNotesEvent`` frames of synthetic notes, as received from
+the server, and reports the memory still allocated once only the notes
+are kept (``tracemalloc``). The baseline is the ``Note`` the plugin had
+before: a ``__dict__`` per instance, and its own copy of the file name and
+severity strings decoded from each message.
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path += [os.path.join(root, "ensimesublime"),
+             os.path.dirname(os.path.abspath(__file__))]
+
+from notes import Note  # noqa: E402
+import standin  # noqa: E402
+
+# notes per NewScalaNotesEvent
+EVENT_SIZE = 100
+
+
+class PlainNote(object):
+    def __init__(self, m):
+        self.message = m['msg']
+        self.file_name = m['file']
+        self.severity = m['severity']['typehint']
+        self.start = m['beg']
+        self.end = m['end']
+        self.line = m['line']
+        self.col = m['col']
+
+
+def receive(frames, note_type):
+    notes = []
+    for frame in frames:
+        notes.extend(note_type(m) for m in json.loads(frame)["payload"]["notes"])
+    return notes
+
+
+def kept(frames, note_type):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        notes = receive(frames, note_type)
+        gc.collect()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return len(notes), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=100000)
+    parser.add_argument("--files", type=int, default=10)
+    args = parser.parse_args()
+
+    frames = [json.dumps({"payload": standin.notes(EVENT_SIZE, args.files, offset=i)})
+              for i in range(0, args.notes, EVENT_SIZE)]
+    print("{:<12} {:>8} {:>10} {:>10}".format("", "notes", "MB", "bytes/note"))
+    for name, note_type in (("plain", PlainNote), ("compact", Note)):
+        count, size = kept(frames, note_type)
+        print("{:<12} {:>8} {:10.1f} {:10.1f}".format(name, count, size / 1024.0 / 1024.0,
+                                                       size / float(count)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# coding: utf-8
+"""Queries on a large number of notes: flat lists vs. the ``NotesStorage`` index.
+
+Run from the repository root::
+
+    python benchmarks/bench_notes.py [--notes N] [--files N] [--repeat N]
+
+Stores ``--notes`` synthetic notes (a third of them errors, the rest
+warnings, as with generated code full of deprecations) over ``--files``
+files, then measures what a redraw asks of them: the notes of a file by
+severity, the notes in a screenful of text and on a range of lines. The
+baseline walks a flat list per file, as ``NotesStorage`` used to keep.
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path += [os.path.join(root, "ensimesublime"),
+             os.path.dirname(os.path.abspath(__file__))]
+
+from notes import Note, NotesStorage  # noqa: E402
+import standin  # noqa: E402
+
+# characters and lines in a screenful of text
+VIEWPORT_CHARS = 5000
+VIEWPORT_LINES = 60
+
+
+def best(fn, repeat):
+    return min(timeit.repeat(fn, number=1, repeat=repeat)) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=100000)
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    notes = [Note(m) for m in standin.notes(args.notes, args.files)["notes"]]
+    flat = {}
+    for note in notes:
+        flat.setdefault(note.file_name, []).append(note)
+    file_name = notes[0].file_name
+    in_file = flat[file_name]
+    middle = in_file[len(in_file) // 2]
+    begin, first_line = middle.start, middle.line
+
+    def store():
+        storage = NotesStorage()
+        storage.append(notes)
+        for name in flat:
+            storage.for_file(name).by_severity("NoteError")
+        return storage
+
+    print("{} notes in {} files, {} in the file queried".format(len(notes), args.files, len(in_file)))
+    print("{:<22} {:>12} {:>12}".format("", "flat ms", "indexed ms"))
+    print("{:<22} {:>12} {:12.3f}".format("store and index", "", best(store, 3)))
+    indexed = store().for_file(file_name)
+
+    queries = [
+        ("by severity",
+         lambda: [n for n in in_file if n.severity == "NoteWarn"],
+         lambda: indexed.by_severity("NoteWarn")),
+        ("in viewport",
+         lambda: [n for n in in_file if n.start < begin + VIEWPORT_CHARS and n.end > begin],
+         lambda: indexed.in_region(begin, begin + VIEWPORT_CHARS)),
+        ("on lines",
+         lambda: [n for n in in_file if first_line <= n.line <= first_line + VIEWPORT_LINES],
+         lambda: indexed.on_lines(first_line, first_line + VIEWPORT_LINES)),
+    ]
+    for name, baseline, query in queries:
+        assert len(baseline()) == len(query())
+        print("{:<22} {:12.3f} {:12.3f}".format(name, best(baseline, args.repeat),
+                                                best(query, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
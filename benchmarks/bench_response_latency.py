@@ -0,0 +1,114 @@
+# coding: utf-8
+"""Round-trip latency of synchronous requests: sleep-polling vs. waiter registry.
+
+Run from the repository root::
+
+    python benchmarks/bench_response_latency.py [--calls N] [--latency SECONDS]
+
+Both modes talk to the same local stand-in server over a real websocket and
+decode responses on a background thread, just like ``EnsimeClient.queue_poll``.
+The ``poll`` mode reproduces the former ``get_response`` loop, which checked a
+shared dict every 0.5 s; the ``event`` mode uses ``ResponseWaiters``.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path += [os.path.join(root, "dependencies"),
+             os.path.join(root, "ensimesublime"),
+             os.path.dirname(os.path.abspath(__file__))]
+
+import websocket  # noqa: E402
+
+from standin import StandInServer  # noqa: E402
+from waiters import ResponseWaiters  # noqa: E402
+
+
+class PollingWaiters(object):
+    """The pre-registry behaviour: a dict checked on a fixed sleep interval."""
+
+    def __init__(self, sleep_t=0.5):
+        self.sleep_t = sleep_t
+        self.responses = {}
+
+    def expect(self, call_id):
+        pass
+
+    def deliver(self, call_id, response):
+        self.responses[call_id] = response
+        return True
+
+    def wait(self, call_id, timeout):
+        start = time.time()
+        while call_id not in self.responses and time.time() - start < timeout:
+            time.sleep(self.sleep_t)
+        return self.responses.pop(call_id, None)
+
+
+def run(waiters, calls, latency):
+    server = StandInServer(latency=latency).start()
+    ws = websocket.create_connection(server.url, subprotocols=["jerky"],
+                                     enable_multithread=True)
+    running = [True]
+
+    def receive():
+        while running[0]:
+            try:
+                frame = ws.recv()
+            except websocket.WebSocketException:
+                break
+            if frame:
+                decoded = json.loads(frame)
+                waiters.deliver(decoded["callId"], decoded)
+
+    receiver = threading.Thread(target=receive)
+    receiver.daemon = True
+    receiver.start()
+
+    samples = []
+    for call_id in range(1, calls + 1):
+        message = json.dumps({"callId": call_id, "req": {"typehint": "ConnectionInfoReq"}})
+        start = time.time()
+        waiters.expect(call_id)
+        ws.send(message + "\n")
+        if waiters.wait(call_id, 5) is None:
+            raise RuntimeError("no response for call {}".format(call_id))
+        samples.append(time.time() - start)
+
+    running[0] = False
+    ws.close()
+    server.stop()
+    return samples
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(name, samples):
+    ms = [s * 1000.0 for s in samples]
+    print("{:<6} n={:<5} min={:8.3f}ms p50={:8.3f}ms p95={:8.3f}ms p99={:8.3f}ms max={:8.3f}ms"
+          .format(name, len(ms), min(ms), percentile(ms, 50), percentile(ms, 95),
+                  percentile(ms, 99), max(ms)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.005,
+                        help="simulated server processing time in seconds")
+    args = parser.parse_args()
+
+    report("poll", run(PollingWaiters(), args.calls, args.latency))
+    report("event", run(ResponseWaiters(), args.calls, args.latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+# coding: utf-8
+"""A minimal stand-in for the ENSIME server, good enough to benchmark the client.
+
+It speaks just enough of RFC 6455 to accept ``jerky`` websocket connections,
+one at a time and as many in a row as the client opens, and answers the
+common requests with canned payloads of configurable size after a
+configurable latency. Replies are scheduled rather than slept on, so
+concurrent requests overlap like they would on a real server. Events, such
+as storms of ``NewScalaNotesEvent``, can be pushed at any time with ``emit``.
+"""
+
+import base64
+import hashlib
+import heapq
+import json
+import socket
+import struct
+import threading
+import time
+
+WS_MAGIC = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OPCODE_TEXT = 0x1
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xa
+
+SOURCE_ROOT = "/home/user/project/src/main/scala/org/example"
+
+
+# ########################## Payloads ##########################
+def connection_info(req, size):
+    return {"typehint": "ConnectionInfo",
+            "pid": None,
+            "implementation": {"name": "stand-in"},
+            "version": "1.0"}
+
+
+def void_response(req, size):
+    return {"typehint": "VoidResponse"}
+
+
+def completion_info_list(req, size):
+    completions = []
+    for i in range(size):
+        completions.append({
+            "typehint": "CompletionInfo",
+            "name": "method{}".format(i),
+            "typeInfo": {"typehint": "ArrowTypeInfo",
+                         "name": "(x: Int, y: String)Option[List[Foo{}]]".format(i),
+                         "resultType": {"typehint": "BasicTypeInfo", "name": "Option",
+                                        "declAs": {"typehint": "Class"},
+                                        "fullName": "scala.Option", "typeArgs": [],
+                                        "members": []},
+                         "paramSections": [{"params": [["x", {"typehint": "BasicTypeInfo",
+                                                              "name": "Int"}],
+                                                       ["y", {"typehint": "BasicTypeInfo",
+                                                              "name": "String"}]],
+                                            "isImplicit": False}]},
+            "relevance": 90 - i % 90,
+            "isInfix": False})
+    return {"typehint": "CompletionInfoList", "prefix": "me", "completions": completions}
+
+
+def symbol_search_results(req, size):
+    syms = []
+    for i in range(size):
+        syms.append({
+            "typehint": "TypeSearchResult",
+            "name": "org.example.module{}.Symbol{}".format(i % 50, i),
+            "localName": "Symbol{}".format(i),
+            "declAs": {"typehint": "Class"},
+            "pos": {"typehint": "LineSourcePosition",
+                    "file": "{}/module{}/Symbol{}.scala".format(SOURCE_ROOT, i % 50, i),
+                    "line": i % 400}})
+    return {"typehint": "SymbolSearchResults", "syms": syms}
+
+
+def import_suggestions(req, size):
+    return {"typehint": "ImportSuggestions",
+            "symLists": [[{"typehint": "TypeSearchResult",
+                           "name": "org.example.module{}.{}".format(i, name),
+                           "localName": name,
+                           "declAs": {"typehint": "Class"}}
+                          for i in range(size)]
+                         for name in req.get("names", [])]}
+
+
+def type_info(req, size):
+    return {"typehint": "BasicTypeInfo", "name": "Foo", "declAs": {"typehint": "Class"},
+            "fullName": "org.example.Foo", "typeArgs": [], "members": []}
+
+
+def symbol_info(req, size):
+    return {"typehint": "SymbolInfo", "name": "foo", "localName": "foo",
+            "declPos": {"typehint": "OffsetSourcePosition",
+                        "file": "{}/Foo.scala".format(SOURCE_ROOT), "offset": 42},
+            "type": type_info(req, size), "isCallable": False}
+
+
+def source_positions(req, size):
+    return {"typehint": "SourcePositions",
+            "positions": [{"typehint": "PositionHint",
+                           "position": {"typehint": "LineSourcePosition",
+                                        "file": "{}/Use{}.scala".format(SOURCE_ROOT, i),
+                                        "line": i % 400}}
+                          for i in range(size)]}
+
+
+def string_response(req, size):
+    return {"typehint": "StringResponse", "text": "docs/org/example/Foo.html"}
+
+
+def notes(size, files=10, offset=0):
+    """A ``NewScalaNotesEvent`` with ``size`` notes spread over ``files`` files."""
+    return {"typehint": "NewScalaNotesEvent",
+            "isFull": False,
+            "notes": [{"file": "{}/File{}.scala".format(SOURCE_ROOT, (offset + i) % files),
+                       "msg": "type mismatch; found: Int required: String ({})".format(i),
+                       "severity": {"typehint": "NoteError" if i % 3 else "NoteWarn"},
+                       "beg": i * 10, "end": i * 10 + 5, "line": i + 1, "col": 1}
+                      for i in range(size)]}
+
+
+def default_responses():
+    """Map of request typehint to ``builder(req, size) -> payload``."""
+    return {"ConnectionInfoReq": connection_info,
+            "CompletionsReq": completion_info_list,
+            "TypecheckFilesReq": void_response,
+            "PublicSymbolSearchReq": symbol_search_results,
+            "ImportSuggestionsReq": import_suggestions,
+            "TypeAtPointReq": type_info,
+            "SymbolAtPointReq": symbol_info,
+            "UsesOfSymbolAtPointReq": source_positions,
+            "DocUriAtPointReq": string_response}
+
+
+class StandInServer(object):
+    """Serves websocket clients on ``127.0.0.1`` from background threads.
+
+    Args:
+        latency (float): seconds to wait before answering each request.
+        responses (dict): request typehint -> callable(req, size) -> payload.
+        payload_size (int): number of entries in list responses.
+    """
+
+    def __init__(self, latency=0.0, responses=None, payload_size=100):
+        self.latency = latency
+        self.responses = responses or default_responses()
+        self.payload_size = payload_size
+        self.requests = 0
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind(("127.0.0.1", 0))
+        self._listener.listen(1)
+        self.port = self._listener.getsockname()[1]
+        self._conn = None
+        self._running = False
+        self._send_lock = threading.Lock()
+        self._replies = []
+        self._replies_ready = threading.Condition()
+
+    @property
+    def url(self):
+        return "ws://127.0.0.1:{}/websocket".format(self.port)
+
+    def start(self):
+        self._running = True
+        for name, target in (('stand-in-server', self._serve), ('stand-in-replies', self._reply)):
+            thread = threading.Thread(name=name, target=target)
+            thread.daemon = True
+            thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        with self._replies_ready:
+            self._replies_ready.notify()
+        self.drop()
+        try:
+            self._listener.close()
+        except socket.error:
+            pass
+
+    def drop(self):
+        """Close the current connection, the client may connect again."""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+                conn.close()
+            except socket.error:
+                pass
+
+    def emit(self, payload):
+        """Push an event (a payload without callId) to the client."""
+        self.send_json({"payload": payload})
+
+    def notes_storm(self, events, notes_per_event, files=10):
+        """Emit a typecheck's worth of notes events, as after a full typecheck."""
+        self.emit({"typehint": "ClearAllScalaNotesEvent"})
+        for i in range(events):
+            self.emit(notes(notes_per_event, files, offset=i * notes_per_event))
+        self.emit({"typehint": "FullTypeCheckCompleteEvent"})
+
+    def _serve(self):
+        while self._running:
+            try:
+                conn, _ = self._listener.accept()
+            except socket.error:
+                break
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._conn = conn
+            try:
+                self._handshake(conn)
+                while True:
+                    opcode, data = self._recv_frame(conn)
+                    if opcode == OPCODE_CLOSE:
+                        self._send_frame(OPCODE_CLOSE, data)
+                        break
+                    elif opcode == OPCODE_PING:
+                        self._send_frame(OPCODE_PONG, data)
+                    elif opcode == OPCODE_TEXT:
+                        self.on_message(json.loads(data.decode("utf-8")))
+            except (socket.error, ValueError):
+                pass
+            finally:
+                if self._conn is conn:
+                    self.drop()
+
+    def on_message(self, message):
+        self.requests += 1
+        req = message["req"]
+        builder = self.responses.get(req["typehint"])
+        if builder is None:
+            payload = {"typehint": "RpcError",
+                       "detail": "unsupported request {}".format(req["typehint"])}
+        else:
+            payload = builder(req, self.payload_size)
+        response = {"callId": message["callId"], "payload": payload}
+        if not self.latency:
+            self.send_json(response)
+            return
+        with self._replies_ready:
+            heapq.heappush(self._replies, (time.time() + self.latency, self.requests, response))
+            self._replies_ready.notify()
+
+    def _reply(self):
+        """Send the scheduled replies once their latency elapsed."""
+        with self._replies_ready:
+            while self._running:
+                if not self._replies:
+                    self._replies_ready.wait()
+                    continue
+                due, _, response = self._replies[0]
+                delay = due - time.time()
+                if delay > 0:
+                    self._replies_ready.wait(delay)
+                    continue
+                heapq.heappop(self._replies)
+                try:
+                    self.send_json(response)
+                except socket.error:
+                    pass
+
+    def send_json(self, obj):
+        self._send_frame(OPCODE_TEXT, json.dumps(obj).encode("utf-8"))
+
+    def _handshake(self, conn):
+        request = b""
+        while b"\r\n\r\n" not in request:
+            chunk = conn.recv(4096)
+            if not chunk:
+                raise socket.error("connection closed during handshake")
+            request += chunk
+        headers = {}
+        for line in request.split(b"\r\n")[1:]:
+            if b":" in line:
+                key, value = line.split(b":", 1)
+                headers[key.strip().lower()] = value.strip()
+        accept = base64.b64encode(hashlib.sha1(headers[b"sec-websocket-key"] + WS_MAGIC).digest())
+        conn.sendall(b"HTTP/1.1 101 Switching Protocols\r\n"
+                     b"Upgrade: websocket\r\n"
+                     b"Connection: Upgrade\r\n"
+                     b"Sec-WebSocket-Protocol: jerky\r\n"
+                     b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+
+    def _recv_exactly(self, conn, n):
+        buf = b""
+        while len(buf) < n:
+            chunk = conn.recv(n - len(buf))
+            if not chunk:
+                raise socket.error("connection closed")
+            buf += chunk
+        return buf
+
+    def _recv_frame(self, conn):
+        b1, b2 = struct.unpack("!BB", self._recv_exactly(conn, 2))
+        opcode = b1 & 0x0f
+        length = b2 & 0x7f
+        if length == 126:
+            length, = struct.unpack("!H", self._recv_exactly(conn, 2))
+        elif length == 127:
+            length, = struct.unpack("!Q", self._recv_exactly(conn, 8))
+        mask = self._recv_exactly(conn, 4) if b2 & 0x80 else None
+        data = self._recv_exactly(conn, length)
+        if mask:
+            key = mask * (length // 4 + 1)
+            data = (int.from_bytes(data, "little") ^
+                    int.from_bytes(key[:length], "little")).to_bytes(length, "little")
+        return opcode, data
+
+    def _send_frame(self, opcode, data):
+        length = len(data)
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | opcode, length)
+        elif length < (1 << 16):
+            header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+        with self._send_lock:
+            conn = self._conn
+            if conn is None:
+                raise socket.error("not connected")
+            conn.sendall(header + data)
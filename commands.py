@@ -2,15 +2,21 @@ import sublime_plugin
 import sublime
 
 import sys
+import os
+import glob
+import json
+import time
+from threading import Thread
 from functools import partial as bind
 
 from core import EnsimeWindowCommand, EnsimeTextCommand
-from env import getEnvironment
+from env import getEnvironment, ensime_envs
 from launcher import EnsimeLauncher
 from client import EnsimeClient
 from util import Util
-from outgoing import (TypeCheckFilesReq,
-                      SymbolAtPointReq,
+from recorder import replay
+from hibernation import HibernationManager
+from outgoing import (SymbolAtPointReq,
                       ImportSuggestionsReq,
                       OrganiseImports,
                       RenameRefactorDesc,
@@ -23,6 +29,118 @@ from outgoing import (TypeCheckFilesReq,
                       HierarchyOfTypeAtPointReq)
 
 
+# seconds between checks for idle servers
+IDLE_CHECK_INTERVAL = 60
+
+hibernation = HibernationManager()
+checking_idle = False
+
+
+def plugin_loaded():
+    global checking_idle
+    checking_idle = True
+    sublime.set_timeout(check_idle, IDLE_CHECK_INTERVAL * 1000)
+
+
+def plugin_unloaded():
+    """On exit or reload, stop the servers or leave them running for the next
+    session to attach to, according to the `keep_server_running` setting."""
+    global checking_idle
+    checking_idle = False
+    for env in list(ensime_envs.values()):
+        if env and env.valid and env.is_running():
+            hibernation.stopped(env)
+            env.shutdown(keep_server=env.settings.get("keep_server_running", False))
+
+
+def configure_hibernation(settings):
+    hibernation.configure(settings.get("hibernate_after", 1800),
+                          settings.get("max_running_servers", 0))
+
+
+def start_server(env):
+    """Launch the server of `env`, or attach to a running one, on a worker
+    thread: spawning the JVM or probing a running server would freeze the
+    editor. Once up, the least recently used servers beyond the
+    `max_running_servers` budget are hibernated, back on the UI thread."""
+    launcher = EnsimeLauncher(env.config,
+                              env.settings.get("attach_to_running_server", True),
+                              env.settings.get("tune_jvm_flags", False))
+    # set right away, so that the environment is seen as running meanwhile
+    env.client = EnsimeClient(env, launcher)
+    env.hibernated = False
+
+    def launch(client):
+        try:
+            started = client.setup()
+        except Exception:
+            env.logger.exception("Couldn't start the server")
+            client.teardown()
+            return
+        if started:
+            sublime.set_timeout(bind(server_started, env), 0)
+    thread = Thread(name='start-server', target=launch, args=(env.client,))
+    thread.daemon = True
+    thread.start()
+
+
+def server_started(env):
+    configure_hibernation(env.settings)
+    for other in hibernation.started(env):
+        hibernate(other, "more than {} servers running".format(hibernation.max_servers))
+
+
+def hibernate(env, reason):
+    hibernation.stopped(env, hibernated=True)
+    if not env.is_running():
+        return
+    env.logger.info("Hibernating the server: %s", reason)
+    env.hibernate()
+    env.status_message("ENSIME server hibernating, it will restart when its window is used")
+
+
+def wake(env):
+    env.logger.info("Restarting the hibernated server")
+    env.status_message("Restarting the ENSIME server")
+    start_server(env)
+
+
+def check_idle():
+    if not checking_idle:
+        return
+    configure_hibernation(sublime.load_settings("Ensime.sublime-settings"))
+    for env in hibernation.idle():
+        hibernate(env, "idle for more than {}s".format(hibernation.idle_timeout))
+    sublime.set_timeout(check_idle, IDLE_CHECK_INTERVAL * 1000)
+
+
+def touch(view):
+    """Activity in a view of a project: its server is kept from hibernating,
+    or started again if hibernated."""
+    env = getEnvironment(view.window())
+    if env is None:
+        return None
+    if env.hibernated:
+        wake(env)
+    else:
+        hibernation.touch(env)
+    return env
+
+
+def unsaved_contents(env, view):
+    """Unsaved changes of the view as ``(contents, contents_in)`` for a request's
+    fileInfo: inline, or written to a file in the cache-dir when the
+    `buffer_contents_in_files` setting is on. Both are None for a saved view."""
+    if not view.is_dirty():
+        return None, None
+    region = sublime.Region(0, view.size())
+    if env.settings.get("buffer_contents_in_files", False):
+        path = env.buffer_files.write(view.id(), view.file_name(), view.change_count(),
+                                      lambda: view.substr(region))
+        return None, path
+    return view.substr(region), None
+
+
 class EnsimeStartup(EnsimeWindowCommand):
     def is_enabled(self):
         return bool(self.env and not self.env.is_running())
@@ -35,9 +153,7 @@ class EnsimeStartup(EnsimeWindowCommand):
             self.env.error_message("Got an error : {t}\n{val}"
                                    .format(t=typ, val=value))
         else:
-            launcher = EnsimeLauncher(self.env.config)
-            self.env.client = EnsimeClient(self.env, launcher)
-            self.env.client.setup()
+            start_server(self.env)
 
 
 class EnsimeShutdown(EnsimeWindowCommand):
@@ -45,6 +161,7 @@ class EnsimeShutdown(EnsimeWindowCommand):
         return bool(self.env and self.env.is_running())
 
     def run(self):
+        hibernation.stopped(self.env)
         self.env.shutdown()
 
 
@@ -60,7 +177,7 @@ class EnsimeToggleErrors(EnsimeWindowCommand):
             self.env.editor.hide_phantoms()
         else:
             self.env.editor.show_errors = True
-            self.env.editor.redraw_all_highlights()
+            self.env.editor.request_redraw_all()
 
 
 class EnsimeClasspathSearch(EnsimeWindowCommand):
@@ -75,22 +192,104 @@ class EnsimeClasspathSearch(EnsimeWindowCommand):
         self.window.show_input_panel("Search : ", '', do_classpath_search, None, None)
 
 
+class EnsimeShowMetrics(EnsimeWindowCommand):
+    def is_enabled(self):
+        return bool(self.env and self.env.is_running())
+
+    def run(self):
+        stats = self.env.client.stats()
+        path = os.path.join(self.env.cache_dir, "metrics.json")
+        with open(path, "w") as f:
+            json.dump(stats, f, indent=2, sort_keys=True)
+
+        view = self.window.new_file()
+        view.set_name("ENSIME metrics")
+        view.set_scratch(True)
+        view.run_command("append", {"characters": self.env.client.metrics.report() +
+                                    "\nFull metrics written to {}\n".format(path)})
+
+
+class EnsimeReplayTraffic(EnsimeWindowCommand):
+    """Feeds the frames received in a recorded session to the response handlers.
+    Works without a server: if none is running the frames go to an offline
+    client, closed once replayed and never stored as the environment's."""
+    def is_enabled(self):
+        return bool(self.env)
+
+    def run(self):
+        if not self.env.is_running():
+            try:
+                self.env.recalc()
+            except Exception:
+                typ, value, traceback = sys.exc_info()
+                self.env.error_message("Got an error : {t}\n{val}"
+                                       .format(t=typ, val=value))
+                return
+
+        recordings = sorted(glob.glob(os.path.join(self.env.cache_dir, "traffic-*.log")),
+                            reverse=True)
+        if not recordings:
+            self.env.status_message("No recorded traffic in {}".format(self.env.cache_dir))
+            return
+
+        def replay_selected(index):
+            if index < 0:
+                return
+            thread = Thread(name='replay', target=self.replay, args=(recordings[index],))
+            thread.daemon = True
+            thread.start()
+
+        self.window.show_quick_panel([os.path.basename(path) for path in recordings],
+                                     replay_selected)
+
+    def replay(self, path):
+        speed = self.env.settings.get("replay_speed", 1.0)
+        start = time.time()
+        client = self.env.client
+        offline = client is None
+        if offline:
+            client = EnsimeClient(self.env, None)
+        try:
+            frames = replay(path, client.handle_incoming_response, speed,
+                            logger=self.env.logger)
+        finally:
+            if offline:
+                client.close()
+        msg = "Replayed {} frames from {} in {:.2f}s".format(frames, os.path.basename(path),
+                                                           time.time() - start)
+        self.env.logger.info(msg)
+        self.env.status_message(msg)
+
+
 class EnsimeEventListener(sublime_plugin.EventListener):
+    def on_activated(self, view):
+        env = touch(view)
+        if env and env.is_connected():
+            env.editor.request_redraw_new(view)
+
+    def on_modified(self, view):
+        touch(view)
+
     def on_load(self, view):
         file = view.file_name()
         if not (Util.is_scala(file) or Util.is_java(file)):
             return
         env = getEnvironment(view.window())
         if env and env.is_connected() and env.client.analyzer_ready:
-            TypeCheckFilesReq([view.file_name()]).run_in(env, async=True)
+            env.client.typechecks.add([file])
 
     def on_post_save(self, view):
         file = view.file_name()
         if not (Util.is_scala(file) or Util.is_java(file)):
             return
-        env = getEnvironment(view.window())
+        env = touch(view)
         if env and env.is_connected() and env.client.analyzer_ready:
-            TypeCheckFilesReq([view.file_name()]).run_in(env, async=True)
+            env.client.typechecks.add([file])
+
+    def on_pre_close(self, view):
+        env = getEnvironment(view.window())
+        if env and env.buffer_files is not None:
+            env.buffer_files.discard(view.id())
 
     def on_query_completions(self, view, prefix, locations):
         file = view.file_name()
@@ -110,12 +309,13 @@ class EnsimeEventListener(sublime_plugin.EventListener):
                 env.logger.info("Search for more suggestions either completed or was cancelled.")
                 return env.editor.suggestions
 
-            contents = (view.substr(sublime.Region(0, view.size())) if view.is_dirty()
-                        else None)
+            contents, contents_in = unsaved_contents(env, view)
             response = CompletionsReq(locations[0],
                                       view.file_name(),
                                       contents,
-                                      max_results=5).run_in(env, async=False)
+                                      max_results=5,
+                                      view_id=view.id(),
+                                      contents_in=contents_in).run_in(env, async=False)
 
             if response is None:
                 return ([],
@@ -123,7 +323,9 @@ class EnsimeEventListener(sublime_plugin.EventListener):
                 env.editor.ignore_prefix = prefix
             else:
                 if len(env.editor.suggestions) > 1:
-                    CompletionsReq(locations[0], view.file_name(), contents).run_in(env, async=True)
+                    CompletionsReq(locations[0], view.file_name(), contents,
+                                   view_id=view.id(),
+                                   contents_in=contents_in).run_in(env, async=True)
                     view.show_popup("Please wait while we query for more suggestions.",
                                     sublime.HIDE_ON_MOUSE_MOVE | sublime.COOPERATE_WITH_AUTO_COMPLETE)
                 return (env.editor.suggestions,
@@ -139,12 +341,12 @@ class EnsimeGoToDefinition(EnsimeTextCommand):
         env = getEnvironment(self.view.window())
         view = self.view
         if len(view.sel()) <= 2:
-            contents = (view.substr(sublime.Region(0, view.size())) if view.is_dirty()
-                        else None)
+            contents, contents_in = unsaved_contents(env, view)
             pos = int(target or view.sel()[0].begin())
             SymbolAtPointReq(view.file_name(),
                              contents,
-                             pos).run_in(env, async=True)
+                             pos,
+                             contents_in=contents_in).run_in(env, async=True)
         else:
             env.status_message("You have multiple cursors. Ensime is confused :/")
 
@@ -158,12 +360,12 @@ class EnsimeFindUsages(EnsimeTextCommand):
         env = getEnvironment(self.view.window())
         view = self.view
         if len(view.sel()) <= 2:
-            contents = (view.substr(sublime.Region(0, view.size())) if view.is_dirty()
-                        else None)
+            contents, contents_in = unsaved_contents(env, view)
             pos = int(target or view.sel()[0].begin())
             UsesOfSymbolAtPointReq(view.file_name(),
                                    contents,
-                                   pos).run_in(env, async=True)
+                                   pos,
+                                   contents_in=contents_in).run_in(env, async=True)
         else:
             env.status_message("You have multiple cursors. Ensime is confused :/")
 
@@ -177,12 +379,12 @@ class EnsimeFindImplementations(EnsimeTextCommand):
         env = getEnvironment(self.view.window())
         view = self.view
         if len(view.sel()) <= 2:
-            contents = (view.substr(sublime.Region(0, view.size())) if view.is_dirty()
-                        else None)
+            contents, contents_in = unsaved_contents(env, view)
             pos = int(target or view.sel()[0].begin())
             HierarchyOfTypeAtPointReq(view.file_name(),
                                       contents,
-                                      pos).run_in(env, async=True)
+                                      pos,
+                                      contents_in=contents_in).run_in(env, async=True)
         else:
             env.status_message("You have multiple cursors. Ensime is confused :/")
 
@@ -262,12 +464,12 @@ class EnsimeShowType(EnsimeTextCommand):
         env = getEnvironment(self.view.window())
         view = self.view
         if len(view.sel()) <= 1:
-            contents = (view.substr(sublime.Region(0, view.size())) if view.is_dirty()
-                        else None)
+            contents, contents_in = unsaved_contents(env, view)
             pos = int(target or view.sel()[0].begin())
             TypeAtPointReq(view.file_name(),
                            contents,
-                           pos).run_in(env, async=True)
+                           pos,
+                           contents_in=contents_in).run_in(env, async=True)
         else:
             env.status_message("You have multiple cursors. Ensime is confused :/")
 
@@ -281,11 +483,11 @@ class EnsimeBrowseDocAtPoint(EnsimeTextCommand):
         env = getEnvironment(self.view.window())
         view = self.view
         if len(view.sel()) <= 1:
-            contents = (view.substr(sublime.Region(0, view.size())) if view.is_dirty()
-                        else None)
+            contents, contents_in = unsaved_contents(env, view)
             pos = int(target or view.sel()[0].begin())
             DocUriAtPointReq(view.file_name(),
                              contents,
-                             pos).run_in(env, async=True)
+                             pos,
+                             contents_in=contents_in).run_in(env, async=True)
         else:
             env.status_message("You have multiple cursors. Ensime is confused :/")
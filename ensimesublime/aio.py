@@ -0,0 +1,274 @@
+# coding: utf-8
+
+import base64
+import hashlib
+import os
+import struct
+import threading
+from concurrent.futures import Future, TimeoutError
+from urllib.parse import urlparse
+
+try:
+    import asyncio
+except ImportError:
+    # Python 3.3, as bundled with Sublime Text 3
+    asyncio = None
+
+import websocket
+from websocket import ABNF
+
+from transport import SendMetrics
+
+CONNECT_TIMEOUT = 10
+WS_MAGIC = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+_loop_lock = threading.Lock()
+_loop = None
+
+
+def shared_loop():
+    """The event loop serving every ``AsyncioTransport``, started on first use
+    in a daemon thread of its own."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(name='ensime-asyncio', target=loop.run_forever)
+            thread.daemon = True
+            thread.start()
+            _loop = loop
+        return _loop
+
+
+class JerkyProtocol(asyncio.Protocol if asyncio is not None else object):
+    """Client side of a websocket speaking the ``jerky`` subprotocol.
+
+    Performs the opening handshake, reassembles text frames for
+    ``on_message`` and answers pings. ``handshake`` is resolved once the
+    server switched protocols, ``on_lost(protocol, msg)`` is called when the
+    connection breaks. All methods run on the event loop thread.
+    """
+
+    def __init__(self, host, port, resource, subprotocols, on_message, on_lost):
+        self.host = host
+        self.port = port
+        self.resource = resource
+        self.subprotocols = subprotocols
+        self.on_message = on_message
+        self.on_lost = on_lost
+        self.handshake = Future()
+        self.key = base64.b64encode(os.urandom(16))
+        self.transport = None
+        self.buffer = bytearray()
+        self.fragments = None
+        self.closing = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        lines = ["GET {} HTTP/1.1".format(self.resource),
+                 "Host: {}:{}".format(self.host, self.port),
+                 "Upgrade: websocket",
+                 "Connection: Upgrade",
+                 "Sec-WebSocket-Key: {}".format(self.key.decode("ascii")),
+                 "Sec-WebSocket-Version: 13"]
+        if self.subprotocols:
+            lines.append("Sec-WebSocket-Protocol: {}".format(",".join(self.subprotocols)))
+        transport.write(("\r\n".join(lines) + "\r\n\r\n").encode("ascii"))
+
+    def data_received(self, data):
+        self.buffer.extend(data)
+        if not self.handshake.done():
+            end = self.buffer.find(b"\r\n\r\n")
+            if end < 0:
+                return
+            head = bytes(self.buffer[:end])
+            del self.buffer[:end + 4]
+            error = self._check_handshake(head)
+            if error:
+                self.fail(error)
+                return
+            self.handshake.set_result(True)
+
+        frame = self._next_frame()
+        while frame is not None:
+            self._on_frame(*frame)
+            frame = self._next_frame()
+
+    def connection_lost(self, exc):
+        self.fail(exc or "connection closed")
+        if not self.closing:
+            self.on_lost(self, str(exc) if exc else "Connection is already closed.")
+
+    def fail(self, error):
+        """Fail the handshake if it is still pending."""
+        if not self.handshake.done():
+            self.handshake.set_exception(websocket.WebSocketException(str(error)))
+            if self.transport is not None:
+                self.closing = True
+                self.transport.close()
+
+    def send(self, data, opcode=ABNF.OPCODE_TEXT):
+        if self.transport is not None and not self.closing:
+            self.transport.write(ABNF.create_frame(data, opcode).format())
+
+    def close(self):
+        if self.transport is not None and not self.closing:
+            self.send(struct.pack("!H", websocket.STATUS_NORMAL), ABNF.OPCODE_CLOSE)
+            self.closing = True
+            self.transport.close()
+
+    def _check_handshake(self, head):
+        lines = head.split(b"\r\n")
+        status = lines[0].split(b" ")
+        if len(status) < 2 or status[1] != b"101":
+            return "Handshake status {}".format(lines[0].decode("latin-1"))
+        headers = {}
+        for line in lines[1:]:
+            if b":" in line:
+                key, value = line.split(b":", 1)
+                headers[key.strip().lower()] = value.strip()
+        expected = base64.b64encode(hashlib.sha1(self.key + WS_MAGIC).digest())
+        if headers.get(b"sec-websocket-accept") != expected:
+            return "Invalid Sec-WebSocket-Accept header"
+        return None
+
+    def _next_frame(self):
+        """Pop a complete frame off the buffer as (opcode, fin, payload)."""
+        buf = self.buffer
+        if len(buf) < 2:
+            return None
+        b1, b2 = buf[0], buf[1]
+        length = b2 & 0x7f
+        offset = 2
+        if length == 126:
+            if len(buf) < 4:
+                return None
+            length, = struct.unpack_from("!H", bytes(buf[2:4]))
+            offset = 4
+        elif length == 127:
+            if len(buf) < 10:
+                return None
+            length, = struct.unpack_from("!Q", bytes(buf[2:10]))
+            offset = 10
+        mask = None
+        if b2 & 0x80:
+            mask = bytes(buf[offset:offset + 4])
+            offset += 4
+        if len(buf) < offset + length:
+            return None
+        payload = bytes(buf[offset:offset + length])
+        del buf[:offset + length]
+        if mask:
+            payload = ABNF.mask(mask, payload)
+        return b1 & 0x0f, b1 >> 7 & 1, payload
+
+    def _on_frame(self, opcode, fin, payload):
+        if opcode in (ABNF.OPCODE_TEXT, ABNF.OPCODE_BINARY, ABNF.OPCODE_CONT):
+            self.fragments = payload if self.fragments is None else self.fragments + payload
+            if fin:
+                data, self.fragments = self.fragments, None
+                self.on_message(data.decode("utf-8"))
+        elif opcode == ABNF.OPCODE_PING:
+            self.send(payload, ABNF.OPCODE_PONG)
+        elif opcode == ABNF.OPCODE_CLOSE:
+            self.close()
+            self.on_lost(self, "Connection closed by the server.")
+
+
+class AsyncioTransport(object):
+    """The websocket connection to an ENSIME server, served by the event loop
+    shared with every other environment.
+
+    The loop thread owns the socket: outgoing frames are queued onto it with
+    ``call_soon_threadsafe`` from whichever thread sends, received frames are
+    passed to ``on_message`` on the loop thread, and the deadlines of pending
+    futures in ``waiters`` are enforced with loop timers. Handlers therefore
+    must not block, as they would hold up every project.
+
+    Same constructor arguments and surface as ``transport.ThreadedTransport``.
+    """
+
+    def __init__(self, waiters, on_message, on_error, on_send_error, logger):
+        self.waiters = waiters
+        self.on_message = on_message
+        self.on_error = on_error
+        # write errors surface as a lost connection, reported to on_error
+        self.on_send_error = on_send_error
+        self.logger = logger
+        self.metrics = SendMetrics()
+        self.loop = shared_loop()
+        self.protocol = None
+        self._expiry = None
+        # new deadlines reschedule the expiry timer through `wake`
+        waiters.wakeup = self
+
+    @property
+    def connected(self):
+        return self.protocol is not None
+
+    def connect(self, url, options):
+        """Open the websocket, raises ``websocket.WebSocketException`` on failure.
+        Blocks the calling thread (never the loop) until the handshake is done."""
+        parsed = urlparse(url)
+        host, port, resource = parsed.hostname, parsed.port or 80, parsed.path or "/"
+        protocol = JerkyProtocol(host, port, resource, options.get("subprotocols"),
+                                 self._receive, self._lost)
+
+        def start():
+            task = self.loop.create_task(self.loop.create_connection(lambda: protocol, host, port))
+            task.add_done_callback(lambda t: t.exception() and protocol.fail(t.exception()))
+
+        self.loop.call_soon_threadsafe(start)
+        try:
+            protocol.handshake.result(CONNECT_TIMEOUT)
+        except TimeoutError:
+            self.loop.call_soon_threadsafe(protocol.fail, "handshake timed out")
+            raise websocket.WebSocketTimeoutException("handshake timed out")
+        self.protocol = protocol
+
+    def send(self, msg):
+        protocol = self.protocol
+        if protocol is not None:
+            self.loop.call_soon_threadsafe(self._write, protocol, msg, self.metrics.enqueued())
+
+    def stats(self):
+        return self.metrics.snapshot()
+
+    def _write(self, protocol, msg, enqueued_at):
+        protocol.send(msg)
+        self.metrics.done(enqueued_at, ok=not protocol.closing)
+
+    def disconnect(self):
+        protocol, self.protocol = self.protocol, None
+        if protocol is not None:
+            self.loop.call_soon_threadsafe(protocol.close)
+
+    def close(self):
+        self.disconnect()
+        self.loop.call_soon_threadsafe(self._cancel_expiry)
+
+    def wake(self):
+        self.loop.call_soon_threadsafe(self._schedule_expiry)
+
+    def _receive(self, text):
+        try:
+            self.on_message(text)
+        except Exception:
+            self.logger.exception("Error while handling a message from the server")
+
+    def _lost(self, protocol, msg):
+        if protocol is self.protocol:
+            self.protocol = None
+            self.on_error(msg)
+
+    def _schedule_expiry(self):
+        self._cancel_expiry()
+        delay = self.waiters.expire()
+        if delay is not None:
+            self._expiry = self.loop.call_later(delay, self._schedule_expiry)
+
+    def _cancel_expiry(self):
+        if self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = None
+
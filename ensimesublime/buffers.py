@@ -0,0 +1,68 @@
+# coding: utf-8
+
+import io
+import os
+import threading
+
+from util import Util
+
+
+class BufferFiles(object):
+    """Unsaved buffer contents written to files, for the ``contentsIn`` form
+    of ENSIME's ``fileInfo`` which has the server read them from disk.
+
+    There is one file per view under ``directory``, rewritten only when the
+    view's change count moved since it was last written, and removed with
+    ``discard`` once the view is closed.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._written = {}
+
+    def path(self, view_id, file_name):
+        # keep the extension, the server picks the compiler by it
+        _, ext = os.path.splitext(file_name or "")
+        return os.path.join(self.directory, "view-{}{}".format(view_id, ext))
+
+    def write(self, view_id, file_name, change_count, contents):
+        """Path of the file holding the contents of the view at ``change_count``.
+
+        ``contents`` is a callable returning the buffer text, only called when
+        the file has to be (re)written.
+        """
+        path = self.path(view_id, file_name)
+        with self._lock:
+            previous = self._written.get(view_id)
+            if previous == (path, change_count):
+                return path
+            if previous is not None and previous[0] != path:
+                self._remove(previous[0])
+            Util.mkdir_p(self.directory)
+            tmp = path + ".tmp"
+            with io.open(tmp, "w", encoding="utf-8", newline="") as f:
+                f.write(contents())
+            # the server may be reading the previous version
+            os.replace(tmp, path)
+            self._written[view_id] = (path, change_count)
+        return path
+
+    def discard(self, view_id):
+        """Remove the file of a closed view."""
+        with self._lock:
+            written = self._written.pop(view_id, None)
+        if written is not None:
+            self._remove(written[0])
+
+    def clear(self):
+        with self._lock:
+            written, self._written = self._written, {}
+        for path, _ in written.values():
+            self._remove(path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -1,19 +1,35 @@
 # coding: utf-8
 import sublime
 
+import itertools
+import socket
+import threading
 import time
-import json
+from concurrent.futures import CancelledError, TimeoutError
 from threading import Thread
 
 import websocket
 # from functools import partial as bind
 
+import codec
 from protocol import ProtocolHandler
 from util import catch, Pretty
 from errors import LaunchError
-from outgoing import ConnectionInfoRequest
+from outgoing import ConnectionInfoRequest, TypeCheckFilesReq
 from config import gconfig
 from debugger import DebugHandler
+from waiters import ResponseWaiters, RequestGenerations, Superseded
+from registry import RequestRegistry
+from transport import create_transport
+from heartbeat import Backoff, Heartbeat
+from metrics import RequestMetrics, FIRST_BYTE, TIMEOUTS, DROPPED, SUPERSEDED
+from recorder import TrafficRecorder, recording_path
+from typecheck import TypecheckScheduler
+from scheduler import RequestScheduler
+from startup import StartupTimeline, wait_until_ready, SPAWNED
+
+# seconds the server has to answer a heartbeat
+HEARTBEAT_TIMEOUT = 10
 
 
 class EnsimeClient(ProtocolHandler, DebugHandler):
@@ -25,13 +41,26 @@ class EnsimeClient(ProtocolHandler, DebugHandler):
     Once constructed, a client instance can either connect to an existing
     ENSIME server or launch a new one with a call to the ``setup()`` method.
 
-    Communication with the server is done over a websocket (`self.ws`). Messages
-    are sent to the server in the calling thread, while messages are received on
-    a separate background thread and enqueued in `self.queue` upon receipt.
+    Communication with the server is done over a websocket owned by
+    `self.transport`. With the default threaded transport messages are queued
+    for a writer thread, while messages are received on a separate background
+    thread and dispatched upon receipt. The asyncio
+    transport (setting `transport_engine`) serves every client from one shared
+    event loop thread instead.
+
+    Requests go through `self.scheduler`, which sends interactive requests
+    right away and holds background ones (typechecks) back while too many
+    of them are in flight.
+
+    `self.heartbeat` probes the server periodically. When the connection is
+    lost while the server process is still alive, the client reconnects with
+    exponential backoff and sends again the idempotent requests in flight.
 
     Each call to the server contains a `callId` field with an integer ID,
-    generated from `self.call_id`. Responses echo back the `callId` field so
-    that appropriate handlers can be invoked.
+    taken from `self.next_call_id()`. Responses echo back the `callId` field so
+    that appropriate handlers can be invoked. Synchronous callers park on
+    `self.waiters` and are woken by the receiving thread as soon as their
+    response is decoded.
 
     Responses also contain a `typehint` field in their `payload` field, which
     contains the type of the response. This is used to key into `self.handlers`,
@@ -44,91 +73,252 @@ class EnsimeClient(ProtocolHandler, DebugHandler):
         self.env = parent_environment
         self.env.logger.debug('__init__: in')
 
-        self.ws = None
         self.ensime = None
         self.ensime_server = None
 
-        self.call_id = 1
-        self.call_options = {}
-        self.refactor_id = 1
-        self.refactorings = {}
+        # Per-request state, dropped once handled or when it outlives its timeout.
+        max_pending = self.env.settings.get("max_pending_requests", 1000)
+        # requests are sent from the UI, heartbeat and reconnecting threads
+        self._call_ids = itertools.count(1)
+        self.call_options = RequestRegistry(max_size=max_pending)
+        self._refactor_ids = itertools.count(1)
+        self.refactorings = RequestRegistry(max_size=max_pending)
         self.connection_timeout = self.env.settings.get("timeout_connection", 20)
 
-        # Map for messages received from the ensime server.
-        self.responses = {}
+        # From spawning the server to its indexer being ready.
+        self.startup = StartupTimeline(self.env.logger)
+        # Latencies per request and response typehint.
+        self.metrics = RequestMetrics()
+        # Every frame sent and received, to replay the session later on.
+        self.recorder = None
+        if self.env.settings.get("record_traffic", False):
+            self.recorder = TrafficRecorder(recording_path(self.env.cache_dir))
+        # Pending responses for synchronous and future-returning requests.
+        self.waiters = ResponseWaiters()
+        # Newest request per supersede key, e.g. completions per view.
+        self.generations = RequestGenerations(max_size=max_pending)
+        # Sends interactive requests first, caps background ones in flight.
+        self.scheduler = RequestScheduler(self.send,
+                                          self.env.settings.get("max_background_requests", 2))
+        # Batches files to typecheck, one TypecheckFilesReq in flight at a time.
+        self.typechecks = TypecheckScheduler(self._typecheck,
+                                             sublime.set_timeout,
+                                             self._active_file,
+                                             self.env.settings.get("typecheck_debounce", 300))
         # By default, don't connect to server more than once
         self.number_try_connection = 1
 
         self.debug_thread_id = None
 
         # status
-        self.running = True  # queue poll is running
+        self.running = True  # client is running
         self.connected = False  # connected to ensime server through websocket
+        self.reconnecting = False  # connection lost, server still running
+        self._reconnect_lock = threading.Lock()
         self.analyzer_ready = False
         self.indexer_ready = False
 
-        thread = Thread(name='queue-poller', target=self.queue_poll)
+        self.transport = create_transport(self.env.settings.get("transport_engine", "threads"),
+                                          self.waiters,
+                                          self._dispatch,
+                                          self._on_connection_lost,
+                                          self._on_send_error,
+                                          self.env.logger)
+        self.heartbeat = Heartbeat(self._probe,
+                                   lambda: self.connected,
+                                   self.reconnect,
+                                   self.env.settings.get("heartbeat_interval", 30))
+
+    def _typecheck(self, files):
+        if not self.connected:
+            return None
+        return TypeCheckFilesReq(files).run_in(self.env, future=True)
+
+    def _active_file(self):
+        view = self.env.window.active_view()
+        return view.file_name() if view is not None else None
+
+    def next_call_id(self):
+        """A call ID no other request got, whatever the thread sending it."""
+        return next(self._call_ids)
+
+    def next_refactor_id(self):
+        return next(self._refactor_ids)
+
+    def _on_connection_lost(self, msg):
+        """Called by the transport when the websocket breaks."""
+        if self.connected:
+            self.env.logger.error('Websocket exception: %s', msg)
+            self.reconnect()
+
+    def _probe(self):
+        """Heartbeat: True if the server answers a ConnectionInfoReq in time."""
+        response = ConnectionInfoRequest(timeout=HEARTBEAT_TIMEOUT).run_in(self.env, future=True)
+        try:
+            response.result(HEARTBEAT_TIMEOUT)
+        except CancelledError:
+            # torn down meanwhile
+            return False
+        except TimeoutError:
+            self.env.logger.warning('no heartbeat from the server for %ss', HEARTBEAT_TIMEOUT)
+            return False
+        return True
+
+    def reconnect(self):
+        """Re-establish the websocket in the background, unless already doing so.
+
+        While the server process is alive, attempts are made with exponential
+        backoff (at most `reconnect_attempts`), then the idempotent requests
+        still awaiting a response are sent again. If all attempts fail the
+        server is shut down, as it used to be right away.
+        """
+        with self._reconnect_lock:
+            if self.reconnecting:
+                return
+            self.reconnecting = True
+        self.connected = False
+        thread = Thread(name='reconnect', target=self._reconnect)
         thread.daemon = True
         thread.start()
 
-    def queue_poll(self, sleep_t=0.5):
-        """Put new messages in the map as they arrive.
-        Since putting a value in a map is an atomic operation,
-        existence of a certain key and retrieval can be done
-        from a separate thread by the client.
-        Value of sleep is low to improve responsiveness.
+    def _reconnect(self):
+        try:
+            self.transport.disconnect()
+            backoff = Backoff(attempts=self.env.settings.get("reconnect_attempts", 8))
+            for attempt, delay in enumerate(backoff, 1):
+                time.sleep(delay)
+                if not (self.running and self.ensime and self.ensime.is_running()):
+                    break
+                self.env.logger.info('Reconnecting, attempt %s', attempt)
+                try:
+                    self.transport.connect(self.ensime_server, self.connection_options())
+                except (websocket.WebSocketException, socket.error) as e:
+                    self.env.logger.info('Reconnection failed: %s', e)
+                    continue
+                if self._probe():
+                    self.connected = True
+                    self.env.logger.info('Reconnected after %s attempt(s)', attempt)
+                    self.resend_in_flight()
+                    return
+                self.transport.disconnect()
+
+            if self.running:
+                self.env.logger.warning("Forcing shutdown. Check server log to see what happened.")
+                # Stop everything.
+                self.shutdown_server()
+                self._display_ws_warning()
+        finally:
+            self.reconnecting = False
+
+    def resend_in_flight(self):
+        """Send again the idempotent requests that haven't been answered yet."""
+        resent = 0
+        for call_id, options in self.call_options.items():
+            message = options.get('message')
+            # requests held back by the scheduler haven't been sent at all yet
+            if message is not None and not self.scheduler.queued(call_id):
+                self.send(message)
+                resent += 1
+        if resent:
+            self.env.logger.info('Sent %s pending request(s) again', resent)
+
+    def stats(self):
+        """Metrics of the requests, the connection and the pending state."""
+        return {"requests": self.metrics.snapshot(),
+                "transport": self.transport.stats(),
+                "heartbeat": self.heartbeat.stats(),
+                "scheduler": self.scheduler.stats(),
+                "startup": self.startup.offsets(),
+                "render": self.env.editor.render.stats(),
+                "call_options": self.call_options.stats(),
+                "superseded": self.generations.stats(),
+                "refactorings": self.refactorings.stats()}
+
+    def _dispatch(self, result):
+        """Decode a frame and either handle it or pass it to its waiter.
+
+        Responses to superseded requests are recognised from the start of the
+        frame and dropped without decoding the rest. A frame that doesn't
+        start with its callId is decoded in full to find it, if it has one.
         """
-        while self.running:
-            if self.ws is not None:
-                def log_and_close(msg):
-                    if self.connected:
-                        self.env.logger.error('Websocket exception', exc_info=True)
-                        self.env.logger.warning("Forcing shutdown. Check server log to see what happened.")
-                        # Stop everything.
-                        self.shutdown_server()
-                        self._display_ws_warning()
-
-                with catch(websocket.WebSocketException, log_and_close):
-                    result = self.ws.recv()
-                    if result:
-                        try:
-                            _json = json.loads(result)
-                        except json.JSONDecodeError as e:
-                            self.env.logger.error(e.msg)
-                        else:
-                            # Watch if it has a callId
-                            call_id = _json.get("callId")
-
-                            def handle_now():
-                                if _json["payload"]:
-                                    self.handle_incoming_response(call_id, _json["payload"])
-
-                            def handle_later():
-                                self.responses[call_id] = _json
-
-                            if call_id is None:
-                                handle_now()
-                            else:
-                                call_opt = self.call_options.get(call_id)
-                                if call_opt and call_opt['async']:
-                                    handle_now()
-                                else:
-                                    handle_later()
-                    else:
-                        time.sleep(sleep_t)
+        received = time.time()
+        if self.recorder is not None:
+            self.recorder.inbound(result)
+        call_id, typehint = codec.peek(result)
+        _json = None
+        if call_id is None:
+            _json = self._decode(result)
+            if _json is None:
+                return
+            # Watch if it has a callId
+            call_id = _json.get("callId")
+            typehint = (_json.get("payload") or {}).get("typehint")
+        if call_id is not None:
+            # frees its slot, if a background request, whatever becomes of it
+            self.scheduler.done(call_id)
+        if call_id is not None and not self.generations.end(call_id):
+            self.env.logger.debug('dropping superseded %s for call ID %s', typehint or 'response', call_id)
+            self.metrics.count(typehint, DROPPED)
+            return
+        if _json is None:
+            _json = self._decode(result)
+            if _json is None:
+                return
+
+        call_opt = self.call_options.get(call_id) if call_id is not None else None
+        if call_opt and 'sent_at' in call_opt:
+            self.metrics.record(call_opt['typehint'], FIRST_BYTE, received - call_opt['sent_at'])
+
+        def handle_now():
+            if _json["payload"]:
+                self.handle_incoming_response(call_id, _json["payload"])
+
+        def handle_later():
+            if not self.waiters.deliver(call_id, _json["payload"]):
+                self.call_options.record_late()
+                self.call_options.pop(call_id, None)
+                self.metrics.count(typehint, DROPPED)
+                self.env.logger.warning('dropping late response for call ID %s', call_id)
+
+        if call_id is None:
+            handle_now()
+        else:
+            if call_opt and call_opt['async']:
+                handle_now()
+                self.call_options.pop(call_id, None)
+            else:
+                handle_later()
+
+    def _decode(self, result):
+        try:
+            return codec.loads(result)
+        except ValueError as e:
+            self.env.logger.error(str(e))
+            return None
+
+    def supersede(self, key, call_id):
+        """Make `call_id` the newest request for `key`, releasing the previous
+        one: its caller stops waiting and its response will be dropped."""
+        stale = self.generations.begin(key, call_id)
+        if stale is not None:
+            self.env.logger.debug('call ID %s supersedes %s', call_id, stale)
+            self.waiters.supersede(stale)
+            self.scheduler.done(stale)
+            call_opt = self.call_options.pop(stale, None)
+            self.metrics.count(call_opt and call_opt.get('typehint'), SUPERSEDED)
 
     def connect_when_ready(self, timeout, fallback):
-        """Given a maximum timeout, waits for the http port to be written.
-        Tries to connect to the websocket if it's written.
+        """Given a maximum timeout, waits for the http port to be written
+        and the server to accept connections, probing with a short backoff.
+        Tries to connect to the websocket once it's ready.
         If it fails cleans up by calling fallback. Ideally, should stop ensime
         process if connection wasn't established.
         """
-        if not self.ws:
-            while not self.ensime.is_ready() and (timeout > 0):
-                time.sleep(1)
-                timeout -= 1
-            if self.ensime.is_ready():
+        if not self.transport.connected:
+            if wait_until_ready(self.ensime, timeout, self.startup):
                 self.connected = self.connect_ensime_server()
+                if self.connected:
+                    self.heartbeat.start()
 
             if not self.connected:
                 fallback()
@@ -144,8 +334,16 @@ class EnsimeClient(ProtocolHandler, DebugHandler):
                 self.env.logger.info("----Initialising server----")
                 try:
                     self.ensime = self.launcher.launch()
+                    if self.ensime.attached:
+                        self.env.logger.info("Attached to the running server (pid %s)", self.ensime.pid)
+                    else:
+                        self.startup.mark(SPAWNED, self.ensime.started_at)
+                    if self.ensime.derived_flags:
+                        self.env.logger.info("JVM flags derived from the project size: %s",
+                                             " ".join(self.ensime.derived_flags))
                 except LaunchError as err:
                     self.env.logger.error(err)
+                    self.env.error_message(str(err))
             return bool(self.ensime)
 
         # True if ensime is up, otherwise False
@@ -164,37 +362,48 @@ class EnsimeClient(ProtocolHandler, DebugHandler):
         sublime.error_message(warning)
 
     def send(self, msg):
-        """Send something to the ensime server."""
-        def reconnect(e):
-            self.env.logger.error('send error, reconnecting...')
-            self.connect_ensime_server()
-            if self.ws:
-                self.ws.send(msg + "\n")
-
+        """Send something to the ensime server.
+        Only queues the message, so it returns right away on any thread."""
         self.env.logger.debug('send: in')
-        if self.ws is not None:
-            with catch(websocket.WebSocketException, reconnect):
-                self.env.logger.debug('send: sending JSON on WebSocket')
-                self.ws.send(msg + "\n")
+        if self.transport.connected:
+            self.env.logger.debug('send: queueing JSON for the WebSocket')
+            if self.recorder is not None:
+                self.recorder.outbound(msg)
+            self.transport.send(msg + "\n")
+
+    def _on_send_error(self, msg, e):
+        """Called by the transport's writer thread when `msg` couldn't be sent.
+        Idempotent requests are sent again once reconnected."""
+        self.env.logger.error('send error, reconnecting... (%s)', e)
+        self.reconnect()
 
     def get_response(self, call_id, timeout):
         """Gets a response with the specified call_id.
-        Waits for the response to appear in the `responses` map for time specified by timeout.
+        Blocks until the receiving thread delivers the response or timeout expires.
+        The waiter must have been registered with `self.waiters.expect` before sending.
         Returns the payload or None based on wether a response for that call_id was found."""
-        start, now = time.time(), time.time()
-        while (call_id not in self.responses) and (now - start) < timeout:
-                time.sleep(0.5)
-                now = time.time()
-        if call_id not in self.responses:
-            print(self.responses)
+        try:
+            payload = self.waiters.wait(call_id, timeout)
+        except Superseded:
+            # already released by `supersede`
+            self.env.logger.debug('call ID %s superseded before its reply', call_id)
+            return None
+        if payload is None:
+            call_opt = self.call_options.pop(call_id, None)
+            self.scheduler.done(call_id)
+            self.metrics.count(call_opt and call_opt.get('typehint'), TIMEOUTS)
             self.env.logger.warning('no reply from server for %ss', timeout)
             return None
-        result = self.responses[call_id]
-        self.env.logger.debug('result received\n%s', Pretty(result))
-        if result["payload"]:
-            self.handle_incoming_response(call_id, result["payload"])
-        del self.responses[call_id]
-        return result["payload"]
+        self.env.logger.debug('result received\n%s', Pretty(payload))
+        self.handle_incoming_response(call_id, payload)
+        self.call_options.pop(call_id, None)
+        return payload
+
+    def connection_options(self):
+        # Use the default timeout (no timeout). Text frames are validated when
+        # decoded already, websocket-client's pure Python check is very slow.
+        return {"subprotocols": ["jerky"], "enable_multithread": True,
+                "skip_utf8_validation": True}
 
     def connect_ensime_server(self):
         """Start initial connection with the server.
@@ -215,12 +424,10 @@ class EnsimeClient(ProtocolHandler, DebugHandler):
                 uri = "websocket"
                 self.ensime_server = gconfig['ensime_server'].format(port, uri)
             with catch(websocket.WebSocketException, disable_completely):
-                # Use the default timeout (no timeout).
-                options = {"subprotocols": ["jerky"]}
-                options['enable_multithread'] = True
+                options = self.connection_options()
                 self.env.logger.info("About to connect to %s with options %s",
                                      self.ensime_server, options)
-                self.ws = websocket.create_connection(self.ensime_server, **options)
+                self.transport.connect(self.ensime_server, options)
             self.number_try_connection -= 1
             got_response = ConnectionInfoRequest().run_in(self.env)  # confirm response
             return bool(got_response is not None)
@@ -240,9 +447,26 @@ class EnsimeClient(ProtocolHandler, DebugHandler):
             self.env.logger.info('Server shutdown.')
         self.env.editor.uncolorize_all()
 
-    def teardown(self):
-        """Shutdown down the client. Stop the server if connected.
+    def teardown(self, keep_server=False):
+        """Shutdown down the client. Stop the server if connected, unless
+        `keep_server`: then it is left running for the next session to attach to.
         This stops the loop receiving responses from the websocket."""
         self.env.logger.debug('teardown: in')
         self.running = False
+        if keep_server and self.ensime:
+            self.ensime.detach()
+            self.ensime = None
+            self.env.logger.info('Server left running.')
+        self.close()
         self.shutdown_server()
+
+    def close(self):
+        """Stop the threads of the client and drop its connection, leaving
+        the server and the views alone."""
+        self.running = False
+        self.connected = False
+        self.heartbeat.stop()
+        self.transport.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        self.waiters.clear()
@@ -0,0 +1,47 @@
+# coding: utf-8
+"""JSON encoding and decoding of the messages exchanged with the server.
+
+Uses ``ujson`` when it is importable (e.g. dropped into Sublime's ``Lib``
+folder) and the standard library otherwise. Either way messages are encoded
+compactly and without escaping non-ASCII characters, the websocket sends them
+as UTF-8.
+"""
+
+import json
+import re
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+if ujson is not None:
+    NAME = "ujson"
+
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+
+    loads = ujson.loads
+else:
+    NAME = "json"
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    loads = json.loads
+
+# The server writes the envelope fields first, `{"callId":N,"payload":{"typehint":"T",...`,
+# only frames starting that way are peeked at.
+_ENVELOPE = re.compile(r'\s*\{\s*(?:"callId"\s*:\s*(\d+)\s*,\s*)?"payload"\s*:\s*'
+                       r'\{\s*"typehint"\s*:\s*"(\w+)"')
+
+
+def peek(text):
+    """The ``(callId, typehint)`` of a received frame, without decoding it.
+
+    Either is None when absent or when the frame doesn't start like a
+    regular envelope, in which case only a full decode can tell: a callId
+    written after the payload is not seen.
+    """
+    match = _ENVELOPE.match(text)
+    if match is None:
+        return None, None
+    call_id, typehint = match.groups()
+    return (int(call_id) if call_id is not None else None), typehint
@@ -1,7 +1,10 @@
 # coding: utf-8
 
-import collections
 import os
+try:
+    from collections.abc import Mapping
+except ImportError:  # Python 2
+    from collections import Mapping
 
 import sexpdata
 
@@ -55,7 +58,7 @@ feedback = {
 #                 .format(project=self.project, config=self.config))
 
 
-class ProjectConfig(collections.Mapping):
+class ProjectConfig(Mapping):
     """A dict-like immutable representation of an ENSIME project configuration.
 
     Args:
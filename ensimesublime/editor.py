@@ -2,6 +2,8 @@ import sublime
 
 import html
 
+from render import RenderScheduler, RenderedViews
+
 
 # view names
 ENSIME_NOTES_VIEW = "Ensime notes"
@@ -20,6 +22,37 @@ ENSIME_STACKFOCUS_REGION = "ensime-stackfocus"
 STATUS_BAR_ERROR = " [Line {line}] {severity} : {msg}"
 STATUSGROUP = "ensime_notes"
 
+PHANTOM_STYLESHEET = '''
+<style>
+    .warn{
+        background-color: color(var(--background) blend(yellow 40%));
+    }
+    div.error, div.warn {
+        padding: 0.4rem 0 0.4rem 0.7rem;
+        margin: 0.2rem 0;
+        border-radius: 2px;
+    }
+    div.error span.message, div.warn span.message {
+        padding-right: 0.5rem;
+        font-size: 0.7rem;
+    }
+    div.error a, div.warn a {
+        text-decoration: inherit;
+        padding: 0.35rem 0.7rem 0.45rem 0.8rem;
+        position: relative;
+        bottom: 0.05rem;
+        border-radius: 0 2px 2px 0;
+        font-weight: bold;
+    }
+    html.dark div.error a, html.dark div.warn a {
+        background-color: #00000018;
+    }
+    html.light div.error a, html.light div.warn a {
+        background-color: #ffffff18;
+    }
+</style>
+'''
+
 
 class Editor(object):
     def __init__(self, window, settings, notes_storage):
@@ -31,12 +64,30 @@ class Editor(object):
         self.suggestions = []
         self.ignore_prefix = None
         self.current_prefix = None
+        # generation of the notes storage when the views were last redrawn
+        self.rendered_generation = 0
+        # views drawn since opened, the others are drawn with the next change
+        self.rendered_views = RenderedViews()
+        # redraws requested from any thread, done on the UI thread once per frame
+        self.render = RenderScheduler(sublime.set_timeout, settings.get("render_interval", 16))
 
     def colorize(self, view=None):
         if view is None:
             view = self.w.active_view()
         # self.uncolorize(view)
-        self.redraw_highlights(view)
+        self.render.request(("view", view.id()), lambda: self.redraw_highlights(view))
+
+    def request_redraw_all(self):
+        self.render.request("all", self.redraw_all_highlights)
+
+    def request_redraw_changed(self):
+        self.render.request("changed", self.redraw_changed)
+
+    def request_redraw_new(self, view):
+        """Draw a view opened since the last redraw, e.g. a clone, without
+        waiting for the next typecheck."""
+        if view.file_name() is not None and not self.rendered_views.drawn(view):
+            self.colorize(view)
 
     def uncolorize(self, view=None):
         if view is None:
@@ -45,6 +96,8 @@ class Editor(object):
         view.erase_regions(ENSIME_WARNING_OUTLINE_REGION)
 
     def uncolorize_all(self):
+        self.render.cancel()
+        self.rendered_views.clear()
         for view in self.w.views():
             self.uncolorize(view)
 
@@ -54,16 +107,34 @@ class Editor(object):
         if(self.show_errors):
             self.update_phantoms()
 
+    def redraw_changed(self):
+        """Redraw the views of the files whose notes changed since the last
+        redraw, clones and split views included, and the views never drawn,
+        leaving the others alone."""
+        changed = set(self.notes_storage.changed_since(self.rendered_generation))
+
+        def file_of(view):
+            file_name = view.file_name()
+            return None if file_name is None else self.notes_storage.normalized(file_name)
+        buffers = set()
+        for view in self.rendered_views.select(self.w.views(), changed, file_of):
+            self.redraw_highlights(view)
+            if self.show_errors and view.buffer_id() not in buffers:
+                buffers.add(view.buffer_id())
+                self.update_phantoms_of(view)
+        self.rendered_generation = self.notes_storage.generation
+
     def redraw_highlights(self, view=None):
         if view is None:
             view = self.w.active_view()
         view.erase_regions(ENSIME_ERROR_OUTLINE_REGION)
         view.erase_regions(ENSIME_WARNING_OUTLINE_REGION)
+        self.rendered_views.rendered(view)
 
         relevant_notes = self.notes_storage.for_file(view.file_name())
 
         # stippled underline the warnings
-        warnings = [view.full_line(note.start) for note in relevant_notes if note.severity == "NoteWarn"]
+        warnings = [view.full_line(note.start) for note in relevant_notes.by_severity("NoteWarn")]
         if self.settings.get("warning_highlight"):
             view.add_regions(
                 ENSIME_WARNING_OUTLINE_REGION,
@@ -72,7 +143,7 @@ class Editor(object):
                 self.settings.get("warning_icon"),
                 sublime.DRAW_NO_FILL)
         # Outline entire errored line
-        errors = [view.full_line(note.start) for note in relevant_notes if note.severity == "NoteError"]
+        errors = [view.full_line(note.start) for note in relevant_notes.by_severity("NoteError")]
         if self.settings.get("error_highlight"):
             view.add_regions(
                 ENSIME_ERROR_OUTLINE_REGION,
@@ -82,66 +153,37 @@ class Editor(object):
                 sublime.DRAW_NO_FILL)
 
     def update_phantoms(self):
-        stylesheet = '''
-            <style>
-                .warn{
-                    background-color: color(var(--background) blend(yellow 40%));
-                }
-                div.error, div.warn {
-                    padding: 0.4rem 0 0.4rem 0.7rem;
-                    margin: 0.2rem 0;
-                    border-radius: 2px;
-                }
-                div.error span.message, div.warn span.message {
-                    padding-right: 0.5rem;
-                    font-size: 0.7rem;
-                }
-                div.error a, div.warn a {
-                    text-decoration: inherit;
-                    padding: 0.35rem 0.7rem 0.45rem 0.8rem;
-                    position: relative;
-                    bottom: 0.05rem;
-                    border-radius: 0 2px 2px 0;
-                    font-weight: bold;
-                }
-                html.dark div.error a, html.dark div.warn a {
-                    background-color: #00000018;
-                }
-                html.light div.error a, html.light div.warn a {
-                    background-color: #ffffff18;
-                }
-            </style>
-        '''
         for file in self.notes_storage.per_file_cache.keys():
             view = self.w.find_open_file(str(file))
             # view is None if no such file is open
             if view:
-                buffer_id = view.buffer_id()
-                if buffer_id not in self.phantom_sets_by_buffer:
-                    phantom_set = sublime.PhantomSet(view, "exec")
-                    self.phantom_sets_by_buffer[buffer_id] = phantom_set
-                else:
-                    phantom_set = self.phantom_sets_by_buffer[buffer_id]
-
-                phantoms = []
-
-                errs = self.notes_storage.for_file(view.file_name())
-
-                for note in errs:
-                    if note.severity == "NoteInfo":
-                        continue
-                    clss = "error" if note.severity == "NoteError" else "warn"
-                    phantoms.append(sublime.Phantom(
-                        sublime.Region(note.start, note.end),
-                        ('<body id=inline-error>' + stylesheet +
-                            '<div class=' + clss + '>' +
-                            '<span class="message">' + html.escape(note.message, quote=False) + '</span>' +
-                            '<a href=hide>' + chr(0x00D7) + '</a></div>' +
-                            '</body>'),
-                        sublime.LAYOUT_BLOCK,
-                        on_navigate=self.on_phantom_navigate))
-
-                phantom_set.update(phantoms)
+                self.update_phantoms_of(view)
+
+    def update_phantoms_of(self, view):
+        buffer_id = view.buffer_id()
+        if buffer_id not in self.phantom_sets_by_buffer:
+            phantom_set = sublime.PhantomSet(view, "exec")
+            self.phantom_sets_by_buffer[buffer_id] = phantom_set
+        else:
+            phantom_set = self.phantom_sets_by_buffer[buffer_id]
+
+        phantoms = []
+
+        notes = self.notes_storage.for_file(view.file_name())
+
+        for clss, severity in (("error", "NoteError"), ("warn", "NoteWarn")):
+            for note in notes.by_severity(severity):
+                phantoms.append(sublime.Phantom(
+                    sublime.Region(note.start, note.end),
+                    ('<body id=inline-error>' + PHANTOM_STYLESHEET +
+                        '<div class=' + clss + '>' +
+                        '<span class="message">' + html.escape(note.message, quote=False) + '</span>' +
+                        '<a href=hide>' + chr(0x00D7) + '</a></div>' +
+                        '</body>'),
+                    sublime.LAYOUT_BLOCK,
+                    on_navigate=self.on_phantom_navigate))
+
+        phantom_set.update(phantoms)
 
     def hide_phantoms(self):
         for file in self.notes_storage.per_file_cache.keys():
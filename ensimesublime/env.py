@@ -10,6 +10,7 @@ import datetime
 import dotensime
 from util import Util
 from notes import NotesStorage
+from buffers import BufferFiles
 from editor import Editor
 from config import LOG_FORMAT, CONSOLE_LOG_FORMAT
 
@@ -71,8 +72,11 @@ class _EnsimeEnvironment(object):
         self.logger = None
         self.valid = False
         self.notes_storage = None
+        self.buffer_files = None
         self.editor = None
         self.client = None
+        # server stopped to save memory, started again on activity
+        self.hibernated = False
         # Not valid when created, you must call recalc while starting up Ensime
         # self.recalc()
 
@@ -130,6 +134,7 @@ class _EnsimeEnvironment(object):
         self.project_root = self.config['root-dir']
         self.notes_storage = NotesStorage()
         self.cache_dir = self.config['cache-dir']
+        self.buffer_files = BufferFiles(os.path.join(self.cache_dir, "buffers"))
         self.editor = Editor(self.window, self.settings, self.notes_storage)
         self.client = None
         # ensure the cache_dir exists otherwise log initialisation will fail
@@ -153,12 +158,23 @@ class _EnsimeEnvironment(object):
     def error_message(self, msg):
         sublime.set_timeout(bind(sublime.error_message, msg), 0)
 
-    def shutdown(self):
+    def hibernate(self):
+        """Stop the server to free its memory, keeping the config, the notes
+        and their highlights until it is started again."""
         self.client.teardown()
+        self.client = None
+        self.hibernated = True
+        self.editor.request_redraw_all()
+
+    def shutdown(self, keep_server=False):
+        self.client.teardown(keep_server)
+        self.buffer_files.clear()
         self.valid = False
         self.notes_storage = None
+        self.buffer_files = None
         self.editor = None
         self.client = None
+        self.hibernated = False
         self.logger.handlers.clear()
         self.logger = None
         # reverting changings to user preferences
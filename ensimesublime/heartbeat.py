@@ -0,0 +1,94 @@
+# coding: utf-8
+
+import threading
+import time
+from threading import Thread
+
+
+class Backoff(object):
+    """Delays between reconnection attempts, growing exponentially from
+    ``initial`` up to ``maximum`` seconds, ``attempts`` of them."""
+
+    def __init__(self, initial=0.5, factor=2, maximum=30, attempts=8):
+        self.initial = initial
+        self.factor = factor
+        self.maximum = maximum
+        self.attempts = attempts
+
+    def __iter__(self):
+        delay = self.initial
+        for _ in range(self.attempts):
+            yield delay
+            delay = min(delay * self.factor, self.maximum)
+
+
+class Heartbeat(object):
+    """Probes the server every ``interval`` seconds and tracks its latency.
+
+    ``probe`` sends a request and returns True if the server answered in
+    time. It is only called while ``active()`` is true, and after ``misses``
+    consecutive unanswered probes ``on_missed`` is called so the connection
+    can be re-established.
+    """
+
+    def __init__(self, probe, active, on_missed, interval=30, misses=2):
+        self.probe = probe
+        self.active = active
+        self.on_missed = on_missed
+        self.interval = interval
+        self.misses = misses
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.beats = 0
+        self.missed = 0
+        self.consecutive_misses = 0
+        self.last_latency = None
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def start(self):
+        """Start probing in a background thread, a no-op if the interval is 0."""
+        if not self.interval or self._thread is not None:
+            return
+        self._thread = Thread(name='heartbeat', target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def beat(self):
+        """Send one probe and record its outcome."""
+        if not self.active():
+            return
+        start = time.time()
+        answered = self.probe()
+        latency = time.time() - start
+        with self._lock:
+            if answered:
+                self.beats += 1
+                self.consecutive_misses = 0
+                self.last_latency = latency
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+                return
+            self.missed += 1
+            self.consecutive_misses += 1
+            lost = self.consecutive_misses >= self.misses
+            if lost:
+                self.consecutive_misses = 0
+        if lost:
+            self.on_missed()
+
+    def stats(self):
+        with self._lock:
+            return {"beats": self.beats,
+                    "missed": self.missed,
+                    "latency_last": self.last_latency,
+                    "latency_avg": self.total_latency / self.beats if self.beats else 0.0,
+                    "latency_max": self.max_latency}
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.beat()
@@ -0,0 +1,65 @@
+# coding: utf-8
+
+import time
+
+
+class HibernationManager(object):
+    """Decides which servers to stop to keep the memory of the JVMs in check.
+
+    Tracks the last activity of every environment with a running server:
+    those idle for more than ``idle_timeout`` seconds are reported by
+    ``idle``, and ``started`` reports the least recently active ones beyond
+    ``max_servers`` running at once. Stopping them (and starting them again
+    when their window is used) is left to the caller. A limit of 0 disables
+    the corresponding check.
+
+    Meant to be used from the UI thread only.
+    """
+
+    def __init__(self, idle_timeout=0, max_servers=0, clock=time.time):
+        self.idle_timeout = idle_timeout
+        self.max_servers = max_servers
+        self.clock = clock
+        self._last_active = {}
+        self.hibernated = 0
+
+    def configure(self, idle_timeout, max_servers):
+        self.idle_timeout = idle_timeout
+        self.max_servers = max_servers
+
+    def touch(self, key):
+        """Record activity for ``key``, if its server is running."""
+        if key in self._last_active:
+            self._last_active[key] = self.clock()
+
+    def started(self, key):
+        """Register the server of ``key`` as running.
+
+        Returns:
+            list: the keys whose servers should be stopped to stay within
+            ``max_servers``, least recently active first.
+        """
+        self._last_active[key] = self.clock()
+        if not self.max_servers or len(self._last_active) <= self.max_servers:
+            return []
+        others = sorted((k for k in self._last_active if k is not key),
+                        key=self._last_active.get)
+        return others[:len(self._last_active) - self.max_servers]
+
+    def stopped(self, key, hibernated=False):
+        """The server of ``key`` was stopped, e.g. because ``idle`` reported it."""
+        if self._last_active.pop(key, None) is not None and hibernated:
+            self.hibernated += 1
+
+    def idle(self):
+        """The keys whose servers had no activity for ``idle_timeout`` seconds."""
+        if not self.idle_timeout:
+            return []
+        cutoff = self.clock() - self.idle_timeout
+        return [key for key, at in self._last_active.items() if at <= cutoff]
+
+    def is_running(self, key):
+        return key in self._last_active
+
+    def stats(self):
+        return {"running": len(self._last_active), "hibernated": self.hibernated}
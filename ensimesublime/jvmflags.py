@@ -0,0 +1,103 @@
+# coding: utf-8
+"""JVM flags for the server sized after the project it serves.
+
+The heap, the garbage collector and the metaspace limit are derived from
+the number of subprojects and source roots in ``.ensime`` and the total
+size of the jars on their classpaths, i.e. roughly from how much the
+presentation compiler and the indexer will have to hold in memory.
+"""
+
+import os
+from collections import namedtuple
+
+MB = 1024 * 1024
+
+HEAP_MIN = 768
+HEAP_MAX = 6144
+# heap above which pauses of the default collectors get noticeable
+G1_FROM_HEAP = 1536
+METASPACE_MIN = 256
+METASPACE_MAX = 1024
+
+ProjectSize = namedtuple("ProjectSize", ["subprojects", "source_roots", "jars_mb"])
+
+
+def _modules(config):
+    """The subprojects of ``:subprojects`` (ENSIME 1) or ``:projects`` (ENSIME 2)."""
+    return list(config.get("subprojects") or []) + list(config.get("projects") or [])
+
+
+def project_size(config):
+    """Measure the project of a ``.ensime`` config. Jars that don't exist
+    (yet) count for nothing, jars shared by subprojects count once."""
+    roots = set()
+    jars = set(config.get("scala-compiler-jars") or [])
+    for module in _modules(config):
+        roots.update(module.get("source-roots") or [])
+        roots.update(module.get("sources") or [])
+        for key in ("compile-deps", "runtime-deps", "test-deps", "library-jars"):
+            jars.update(path for path in module.get(key) or [] if path.endswith(".jar"))
+    total = 0
+    for jar in jars:
+        try:
+            total += os.path.getsize(jar)
+        except OSError:
+            pass
+    return ProjectSize(len(_modules(config)), len(roots), total // MB)
+
+
+def _round_up(mb, step):
+    return -(-int(mb) // step) * step
+
+
+def derive_flags(size):
+    """``-Xms``/``-Xmx``, GC and ``-XX:MaxMetaspaceSize`` flags for a ``ProjectSize``."""
+    heap = HEAP_MIN + 64 * size.subprojects + 16 * size.source_roots + 1.5 * size.jars_mb
+    heap = min(max(_round_up(heap, 256), HEAP_MIN), HEAP_MAX)
+    metaspace = METASPACE_MIN + size.jars_mb / 2.0
+    metaspace = min(max(_round_up(metaspace, 64), METASPACE_MIN), METASPACE_MAX)
+    gc = "-XX:+UseG1GC" if heap >= G1_FROM_HEAP else "-XX:+UseParallelGC"
+    return ["-Xms{}m".format(max(heap // 4, 256)),
+            "-Xmx{}m".format(heap),
+            gc,
+            "-XX:MaxMetaspaceSize={}m".format(metaspace)]
+
+
+def _kind(flag):
+    """What a flag sets, to tell whether a user flag overrides a derived one.
+
+    The initial and maximum heap sizes go together: a derived ``-Xms`` kept
+    next to a smaller ``-Xmx`` of the user's would stop the JVM from starting.
+    """
+    if flag.startswith("-Xms") or flag.startswith("-XX:InitialHeapSize"):
+        return "heap"
+    if flag.startswith("-Xmx") or flag.startswith("-XX:MaxHeapSize"):
+        return "heap"
+    if flag.startswith("-XX:+Use") and flag.endswith("GC"):
+        return "gc"
+    if flag.startswith("-XX:MaxMetaspaceSize"):
+        return "metaspace"
+    return flag
+
+
+def merge_flags(user_flags, derived):
+    """The user's flags, preceded by the derived ones they don't override.
+
+    Returns:
+        tuple: ``(flags, applied)``, all the flags and the derived ones kept.
+    """
+    user_flags = [flag for flag in user_flags if flag]
+    overridden = set(_kind(flag) for flag in user_flags)
+    applied = [flag for flag in derived if _kind(flag) not in overridden]
+    return applied + user_flags, applied
+
+
+def tuned_java_flags(config):
+    """The ``java-flags`` of ``config`` with flags derived from the project size.
+
+    Returns:
+        tuple: ``(flags, applied, size)``
+    """
+    size = project_size(config)
+    flags, applied = merge_flags(config.get("java-flags") or [], derive_flags(size))
+    return flags, applied, size
@@ -1,40 +1,156 @@
 # coding: utf-8
 
 import errno
+import json
 import os
 import signal
 import socket
 import subprocess
 import datetime
+import time
 from abc import ABCMeta, abstractmethod
 from fnmatch import fnmatch
 
+import websocket
+
 from util import catch, Util
 from errors import LaunchError, InvalidJavaPathError
+from jvmflags import tuned_java_flags
+from startup import accepts_connections
+
+
+# seconds an already running server has to answer ConnectionInfoReq
+ATTACH_TIMEOUT = 2
+
+
+def server_files(cache_dir):
+    """The files a running server is known by: its pid, http and tcp ports."""
+    return [os.path.join(cache_dir, name) for name in ("server.pid", "http", "port")]
+
+
+def pid_alive(pid):
+    """Whether a process with this pid exists, without signalling it."""
+    if os.name == "nt":
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        code = ctypes.c_ulong()
+        try:
+            found = kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+        finally:
+            kernel32.CloseHandle(handle)
+        return bool(found) and code.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def answers_connection_info(port, timeout=ATTACH_TIMEOUT, connect=websocket.create_connection):
+    """Whether an ENSIME server on ``port`` answers a ConnectionInfoReq
+    within ``timeout`` seconds. Frames other than the reply, e.g. events
+    sent to every client, are skipped."""
+    deadline = time.time() + timeout
+    try:
+        ws = connect("ws://127.0.0.1:{}/websocket".format(port),
+                     subprotocols=["jerky"], timeout=timeout)
+    except (websocket.WebSocketException, socket.error):
+        return False
+    try:
+        ws.send(json.dumps({"callId": 0, "req": {"typehint": "ConnectionInfoReq"}}))
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            ws.settimeout(remaining)
+            response = json.loads(ws.recv())
+            if response.get("callId") == 0:
+                return (response.get("payload") or {}).get("typehint") == "ConnectionInfo"
+    except (websocket.WebSocketException, socket.error, ValueError, AttributeError):
+        return False
+    finally:
+        ws.close()
+
+
+def attach(cache_dir, timeout=ATTACH_TIMEOUT):
+    """The server left running in ``cache_dir`` by an earlier session, if any.
+
+    The pid in ``server.pid`` must be alive and the port in ``http`` answer a
+    ConnectionInfoReq. The files of a server that is gone are removed, as
+    are those of a pid reused by a process that doesn't listen on the port.
+
+    Returns:
+        EnsimeProcess: A handle for the running server, or None.
+
+    Raises:
+        LaunchError: If the server is there but doesn't answer in time, e.g.
+            while busy indexing. Spawning another one on the same cache-dir
+            would only make things worse.
+    """
+    pid_path, http_path, _ = server_files(cache_dir)
+    try:
+        pid = int(Util.read_file(pid_path))
+        port = int(Util.read_file(http_path))
+    except (IOError, OSError, ValueError):
+        return None
+
+    def cleanup():
+        for path in server_files(cache_dir):
+            with catch(Exception):
+                os.remove(path)
+
+    if not pid_alive(pid) or not accepts_connections(port):
+        cleanup()
+        return None
+    if not answers_connection_info(port, timeout):
+        raise LaunchError("The server running in {} (pid {}) doesn't answer yet. Try again "
+                          "once it is ready, or stop it.".format(cache_dir, pid))
+    return EnsimeProcess(cache_dir, None, cleanup, pid=pid)
 
 
 class EnsimeProcess(object):
+    """A server process, spawned by this session or attached to by ``pid``."""
+    # JVM flags derived from the project size it was started with, if any
+    derived_flags = ()
 
-    def __init__(self, cache_dir, process, cleanup):
+    def __init__(self, cache_dir, process, cleanup, pid=None):
         self.cache_dir = cache_dir
         self.process = process
+        self.pid = process.pid if process is not None else pid
+        # None when attached to a server spawned by an earlier session
+        self.started_at = time.time() if process is not None else None
         self.__stopped_manually = False
         self.__cleanup = cleanup
 
+    @property
+    def attached(self):
+        return self.process is None and self.pid is not None
+
     def stop(self):
-        if self.process is None:
+        if self.pid is None:
             return
         try:
-            os.kill(self.process.pid, signal.SIGTERM)
+            os.kill(self.pid, signal.SIGTERM)
         except PermissionError:
-            subprocess.Popen("taskkill /F /T /PID %i" % self.process.pid , shell=True)
+            subprocess.Popen("taskkill /F /T /PID %i" % self.pid , shell=True)
+        except OSError:
+            pass  # already gone
         self.__cleanup()
         self.__stopped_manually = True
 
+    def detach(self):
+        """Leave the server running, with its files, for the next session."""
+        self.__stopped_manually = True
+
     def aborted(self):
         return not (self.__stopped_manually or self.is_running())
 
     def is_running(self):
+        if self.attached:
+            return pid_alive(self.pid)
         # What? If there's no process, it's running? This is mad confusing.
         return self.process is None or self.process.poll() is None
 
@@ -55,10 +171,13 @@ class EnsimeProcess(object):
 
 
 class EnsimeLauncher(object):
-    """Launches ENSIME processes"""
+    """Launches ENSIME processes, or attaches to the one left running in the
+    project's cache-dir if ``attach_running``. With ``tune_jvm`` the JVM
+    flags not set in ``.ensime`` are derived from the size of the project."""
 
-    def __init__(self, config):
+    def __init__(self, config, attach_running=False, tune_jvm=False):
         self.config = config
+        self.attach_running = attach_running
         assembly = AssemblyJar(config, config['root-dir'])
 
         # Do we need to check if "ensime-server-jars" is defined in .ensime
@@ -66,8 +185,13 @@ class EnsimeLauncher(object):
             self.strategy = assembly
         else:
             self.strategy = DotEnsimeLauncher(config)
+        self.strategy.tune_jvm = tune_jvm
 
     def launch(self):
+        if self.attach_running:
+            process = attach(self.config['cache-dir'])
+            if process is not None:
+                return process
         return self.strategy.launch()
 
 
@@ -86,6 +210,8 @@ class LaunchStrategy:
 
     def __init__(self, config):
         self.config = config
+        # derive heap, GC and metaspace flags from the project size
+        self.tune_jvm = False
 
     @abstractmethod
     def isinstalled(self):
@@ -119,6 +245,9 @@ class LaunchStrategy:
         """
         cache_dir = self.config['cache-dir']
         java_flags = self.config['java-flags']
+        derived_flags = []
+        if self.tune_jvm:
+            java_flags, derived_flags, _ = tuned_java_flags(self.config)
 
         Util.mkdir_p(cache_dir)
         log_path = os.path.join(cache_dir, "server.log")
@@ -159,19 +288,19 @@ class LaunchStrategy:
                 stdin=null,
                 stdout=log,
                 stderr=subprocess.STDOUT)
-        pid_path = os.path.join(cache_dir, "server.pid")
+        pid_path = server_files(cache_dir)[0]
         Util.write_file(pid_path, str(process.pid))
-        http_path = os.path.join(cache_dir, "http")
-        port_path = os.path.join(cache_dir, "port")
 
         def on_stop():
             log.close()
             null.close()
-            for path in [pid_path, http_path, port_path]:
+            for path in server_files(cache_dir):
                 with catch(Exception):
                     os.remove(path)
 
-        return EnsimeProcess(cache_dir, process, on_stop)
+        ensime = EnsimeProcess(cache_dir, process, on_stop)
+        ensime.derived_flags = derived_flags
+        return ensime
 
 
 class AssemblyJar(LaunchStrategy):
@@ -0,0 +1,140 @@
+# coding: utf-8
+
+import math
+import threading
+
+# sub-buckets per power of two, bounds the relative error of a value to 1/16
+SUB_BUCKET_BITS = 5
+
+SEND = "send"
+FIRST_BYTE = "first_byte"
+HANDLER = "handler"
+STAGES = (SEND, FIRST_BYTE, HANDLER)
+
+TIMEOUTS = "timeouts"
+DROPPED = "dropped"
+SUPERSEDED = "superseded"
+COUNTERS = (TIMEOUTS, DROPPED, SUPERSEDED)
+
+PERCENTILES = (50, 95, 99)
+
+# typehint of frames that couldn't be attributed to a request or response
+UNKNOWN = "unknown"
+
+
+class Histogram(object):
+    """Latencies in log-linear buckets, in the manner of HdrHistogram.
+
+    Values are kept in microseconds; each power of two is split in 16
+    buckets so any percentile is off by at most 1/16 of its value while
+    memory only grows with the range of values, not their number.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, seconds):
+        value = max(0, int(seconds * 1000000))
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, pct):
+        """The value in seconds below which ``pct`` percent of the values fall."""
+        if not self.count:
+            return 0.0
+        rank = max(1, int(math.ceil(pct / 100.0 * self.count)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._highest(index), self.max) / 1000000.0
+        return self.max / 1000000.0
+
+    def mean(self):
+        return self.total / 1000000.0 / self.count if self.count else 0.0
+
+    @staticmethod
+    def _index(value):
+        if value < (1 << SUB_BUCKET_BITS):
+            return value
+        shift = value.bit_length() - SUB_BUCKET_BITS
+        return (shift << SUB_BUCKET_BITS) + (value >> shift)
+
+    @staticmethod
+    def _highest(index):
+        """The highest value sharing the bucket ``index``."""
+        shift = index >> SUB_BUCKET_BITS
+        if not shift:
+            return index
+        mantissa = index - (shift << SUB_BUCKET_BITS)
+        return ((mantissa + 1) << shift) - 1
+
+
+class RequestMetrics(object):
+    """Latency histograms and counters per typehint.
+
+    Stages are ``send`` (building and queueing a request), ``first_byte``
+    (from queueing a request to receiving the frame of its response) and
+    ``handler`` (running the handler of a response). Request typehints have
+    the first two, response typehints the last one. Counters track requests
+    that timed out and responses that were dropped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def record(self, typehint, stage, seconds):
+        typehint = typehint or UNKNOWN
+        with self._lock:
+            histogram = self._histograms.get((typehint, stage))
+            if histogram is None:
+                histogram = self._histograms[(typehint, stage)] = Histogram()
+            histogram.record(seconds)
+
+    def count(self, typehint, counter):
+        typehint = typehint or UNKNOWN
+        with self._lock:
+            key = (typehint, counter)
+            self._counters[key] = self._counters.get(key, 0) + 1
+
+    def snapshot(self):
+        """``{typehint: {stage: {count, mean, p50, p95, p99, max}, counter: n}}``,
+        durations in milliseconds."""
+        result = {}
+        with self._lock:
+            for (typehint, stage), histogram in self._histograms.items():
+                summary = {"count": histogram.count,
+                           "mean": histogram.mean() * 1000,
+                           "max": histogram.max / 1000.0}
+                for pct in PERCENTILES:
+                    summary["p{}".format(pct)] = histogram.percentile(pct) * 1000
+                result.setdefault(typehint, {})[stage] = summary
+            for (typehint, counter), n in self._counters.items():
+                result.setdefault(typehint, {})[counter] = n
+        return result
+
+    def report(self):
+        """The snapshot as a plain text table."""
+        header = "{:<32} {:<10} {:>7} {:>10} {:>10} {:>10} {:>10}".format(
+            "typehint", "stage", "count", "p50 ms", "p95 ms", "p99 ms", "max ms")
+        lines = [header, "-" * len(header)]
+        snapshot = self.snapshot()
+        for typehint in sorted(snapshot):
+            entry = snapshot[typehint]
+            for stage in STAGES:
+                if stage in entry:
+                    s = entry[stage]
+                    lines.append("{:<32} {:<10} {:>7} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f}".format(
+                        typehint, stage, s["count"], s["p50"], s["p95"], s["p99"], s["max"]))
+            counters = ", ".join("{} {}".format(entry[c], c) for c in COUNTERS if c in entry)
+            if counters:
+                lines.append("{:<32} {}".format(typehint, counters))
+        return "\n".join(lines) + "\n"
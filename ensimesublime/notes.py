@@ -1,32 +1,167 @@
+import threading
+from bisect import bisect_left, bisect_right
+from operator import attrgetter
+from sys import intern
+
 from paths import normalize_path
 
+# note severities, as the server's typehints
+ERROR = "NoteError"
+WARN = "NoteWarn"
+INFO = "NoteInfo"
+SEVERITIES = dict((severity, severity) for severity in (ERROR, WARN, INFO))
+
 
 class Note(object):
+    """A compiler note. Projects can keep hundreds of thousands of them, so
+    they have no ``__dict__`` and share their file name and severity
+    strings with the other notes."""
+    __slots__ = ("message", "file_name", "severity", "start", "end", "line", "col")
+
     def __init__(self, m):
         self.message = m['msg']
-        self.file_name = m['file']
-        self.severity = m['severity']['typehint']
+        self.file_name = intern(m['file'])
+        severity = m['severity']['typehint']
+        self.severity = SEVERITIES.get(severity) or intern(severity)
         self.start = m['beg']
         self.end = m['end']
         self.line = m['line']
         self.col = m['col']
 
 
-# Make it smarter
+class FileNotes(object):
+    """The notes of one file, indexed to find those of a region, a range of
+    lines or a severity without walking all of them.
+
+    Notes are kept sorted by start offset, and bucketed by line and by
+    severity. A note intersects ``[begin, end)`` if it starts before ``end``
+    and ends after ``begin``: as none is longer than the longest one, only
+    those starting from ``begin`` minus that length need to be checked.
+
+    Added notes are indexed lazily, on the next query, so a storm of notes
+    events costs one sort rather than one insertion per note. Notes are
+    added from the receiving thread while the editor queries them from the
+    UI thread, hence the lock.
+
+    The editor draws whole files, with the severity buckets: highlights
+    have to be in place before a part of the file is scrolled into view.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+        self._notes = []
+        self._starts = []
+        self._longest = 0
+        self._lines = []
+        self._by_line = {}
+        self._by_severity = {}
+
+    def append(self, note):
+        with self._lock:
+            self._pending.append(note)
+
+    def extend(self, notes):
+        with self._lock:
+            self._pending.extend(notes)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._notes) + len(self._pending)
+
+    def __iter__(self):
+        """The notes in offset order."""
+        with self._lock:
+            return iter(self._index())
+
+    def in_region(self, begin, end):
+        """The notes intersecting ``[begin, end)``, in offset order. A note is
+        considered one character long at least."""
+        with self._lock:
+            notes = self._index()
+            lo = bisect_left(self._starts, begin - self._longest)
+            hi = bisect_left(self._starts, max(end, begin + 1))
+        return [note for note in notes[lo:hi] if max(note.end, note.start + 1) > begin]
+
+    def on_lines(self, first, last):
+        """The notes on lines ``first`` to ``last`` included."""
+        with self._lock:
+            self._index()
+            lo = bisect_left(self._lines, first)
+            hi = bisect_right(self._lines, last)
+            return [note for line in self._lines[lo:hi] for note in self._by_line[line]]
+
+    def by_severity(self, severity):
+        """The notes of a severity, e.g. ``"NoteError"``, in offset order."""
+        with self._lock:
+            self._index()
+            return self._by_severity.get(severity, [])
+
+    def signature(self):
+        """A hash of what the notes would render as."""
+        with self._lock:
+            notes = self._index()
+        return hash(tuple((note.start, note.end, note.severity, note.message)
+                          for note in notes))
+
+    def _index(self):
+        """Index the pending notes, the caller holds the lock."""
+        if self._pending:
+            pending, self._pending = self._pending, []
+            notes = self._notes + pending
+            # mostly sorted already: notes come in offset order per event
+            notes.sort(key=attrgetter("start"))
+            self._notes = notes
+            self._starts = [note.start for note in notes]
+            self._longest = max(max(note.end - note.start for note in notes), 1)
+            self._by_line = {}
+            self._by_severity = {}
+            for note in notes:
+                self._by_line.setdefault(note.line, []).append(note)
+                self._by_severity.setdefault(note.severity, []).append(note)
+            self._lines = sorted(self._by_line)
+        return self._notes
+
+
 class NotesStorage(object):
+    """The notes of the project per normalized file name.
+
+    The store is double-buffered: after ``clear`` the notes go to a pending
+    generation, ``pending_cache``, while ``per_file_cache`` keeps the notes
+    shown until then. ``swap`` replaces them at once, e.g. when the
+    typecheck is complete, so there are no empty or partial states to
+    render in between. Without a pending generation notes are added to
+    the visible ones.
+
+    Every file whose notes changed gets a new generation, taken from a
+    counter increasing with each change. Files are only compared when
+    asked with ``changed_since``: notes cleared and then reported again
+    identically, as after each full typecheck, don't make a change.
+    """
+
     def __init__(self):
         self.normalized_cache = {}
         self.per_file_cache = {}
+        self.pending_cache = None
+        self.generation = 0
+        self.generations = {}
+        self._signatures = {}
+        self._touched = set()
+        self._lock = threading.RLock()
 
     def append(self, data):
         data = list(data)
-        for datum in data:
-            if datum.file_name not in self.normalized_cache:
-                self.normalized_cache[datum.file_name] = normalize_path(datum.file_name)
-            file_name = self.normalized_cache[datum.file_name]
-            if file_name not in self.per_file_cache:
-                self.per_file_cache[file_name] = []
-            self.per_file_cache[file_name].append(datum)
+        with self._lock:
+            target = self.per_file_cache if self.pending_cache is None else self.pending_cache
+            for datum in data:
+                if datum.file_name not in self.normalized_cache:
+                    self.normalized_cache[datum.file_name] = normalize_path(datum.file_name)
+                file_name = self.normalized_cache[datum.file_name]
+                if file_name not in target:
+                    target[file_name] = FileNotes()
+                target[file_name].append(datum)
+                if target is self.per_file_cache:
+                    self._touched.add(file_name)
 
     # def filter_files(self, filenames):
     #     dropouts = list(normalize_path(filename) for filename in filenames)
@@ -35,7 +170,34 @@ class NotesStorage(object):
     #             del self.per_file_cache[file_name]
 
     def clear(self):
-        self.per_file_cache.clear()
+        """Start a pending generation, the notes shown stay until ``swap``."""
+        with self._lock:
+            self.pending_cache = {}
+
+    def swap(self):
+        """Show the pending generation, if any. Returns whether there was one."""
+        with self._lock:
+            if self.pending_cache is None:
+                return False
+            self._touched.update(self.per_file_cache)
+            self._touched.update(self.pending_cache)
+            self.per_file_cache, self.pending_cache = self.pending_cache, None
+            return True
+
+    def changed_since(self, generation):
+        """The normalized names of the files whose notes changed after
+        ``generation``, e.g. the value of ``self.generation`` when the notes
+        were last rendered."""
+        with self._lock:
+            touched, self._touched = self._touched, set()
+            for file_name in touched:
+                notes = self.per_file_cache.get(file_name)
+                signature = notes.signature() if notes else None
+                if signature != self._signatures.get(file_name):
+                    self.generation += 1
+                    self.generations[file_name] = self.generation
+                    self._signatures[file_name] = signature
+            return [f for f, g in self.generations.items() if g > generation]
 
     # requires self.data
     # def filter_notes(self, pred):
@@ -46,10 +208,14 @@ class NotesStorage(object):
     #         if file_name in dropouts:
     #             del self.per_file_cache[file_name]
 
-    def for_file(self, file_name):
+    def normalized(self, file_name):
         if file_name not in self.normalized_cache:
             self.normalized_cache[file_name] = normalize_path(file_name)
-        file_name = self.normalized_cache[file_name]
-        if file_name not in self.per_file_cache:
-            self.per_file_cache[file_name] = []
-        return self.per_file_cache[file_name]
+        return self.normalized_cache[file_name]
+
+    def for_file(self, file_name):
+        file_name = self.normalized(file_name)
+        with self._lock:
+            if file_name not in self.per_file_cache:
+                self.per_file_cache[file_name] = FileNotes()
+            return self.per_file_cache[file_name]
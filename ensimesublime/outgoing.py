@@ -1,33 +1,86 @@
-import json
+import time
+from concurrent.futures import TimeoutError
+
+import codec
+from metrics import SEND, TIMEOUTS
+from scheduler import INTERACTIVE, BACKGROUND
 
 from util import Pretty
 
 DEFAULT_TIMEOUT = 300
 COMPLETION_TIMEOUT = 5
+TYPECHECK_TIMEOUT = 60
 
 
 class RpcRequest(object):
+    # whether the request can safely be sent again, e.g. after a reconnect
+    idempotent = False
+    # background requests are held back while interactive ones are in flight
+    priority = INTERACTIVE
 
     def send_request(self, request, client, async):
         """Send a request to the server."""
-        client.env.logger.debug('send_request: in')
-
-        message = {'callId': client.call_id, 'req': request}
-        client.call_options[client.call_id] = {'async': async}
-        client.call_options[client.call_id].update(self.call_options())
-        client.env.logger.info('send_request: %s', Pretty(message))
-        client.send(json.dumps(message))
-
-        call_id = client.call_id
-        client.call_id += 1
+        call_id, _ = self._send(request, client, async)
         return call_id
 
-    def run_in(self, env, async=False):
-        call_id = self.send_request(self.json_repr(), env.client, async)
+    def _send(self, request, client, async, timeout=None):
+        """Send a request to the server.
+        Returns its call ID and, unless `async`, the future for its response."""
+        client.env.logger.debug('send_request: in')
+        start = time.time()
+
+        call_id = client.next_call_id()
+        message = {'callId': call_id, 'req': request}
+        encoded = codec.dumps(message)
+        options = {'async': async, 'typehint': request.get('typehint')}
+        options.update(self.call_options())
+        if self.idempotent:
+            # kept until handled, to be sent again if the connection drops meanwhile
+            options['message'] = encoded
+        client.call_options.maybe_sweep()
+        client.call_options.put(call_id, options, getattr(self, 'timeout', DEFAULT_TIMEOUT))
+        response = None
         if not async:
-            timeout = getattr(self, 'timeout', DEFAULT_TIMEOUT)
-            response = env.client.get_response(call_id, timeout=timeout)
+            # register before sending so that a fast reply can't be missed
+            response = client.waiters.expect(call_id, timeout)
+        key = self.supersede_key()
+        if key is not None:
+            client.supersede(key, call_id)
+        client.env.logger.info('send_request: %s', Pretty(message))
+        options['sent_at'] = time.time()
+        client.scheduler.submit(call_id, encoded, self.priority,
+                                getattr(self, 'timeout', DEFAULT_TIMEOUT))
+        client.metrics.record(request.get('typehint'), SEND, time.time() - start)
+        return call_id, response
+
+    def run_in(self, env, async=False, future=False):
+        """Send this request through the client of `env`.
+
+        By default blocks until the response has been handled and returns its
+        payload, or None on timeout. With `async` the response is left to the
+        handler registered for its typehint. With `future` an `RpcFuture` for
+        the payload is returned right away; the typehint handler is not
+        invoked, callbacks added to the future take its place.
+        """
+        return self._run(self.json_repr(), env, async, future)
+
+    def _run(self, request, env, async, future):
+        client = env.client
+        timeout = getattr(self, 'timeout', DEFAULT_TIMEOUT)
+        if future:
+            call_id, response = self._send(request, client, False, timeout)
+
+            def release(response):
+                client.waiters.discard(call_id)
+                client.scheduler.done(call_id)
+                client.call_options.pop(call_id, None)
+                if not response.cancelled() and isinstance(response.exception(), TimeoutError):
+                    client.metrics.count(request.get('typehint'), TIMEOUTS)
+            response.add_done_callback(release)
             return response
+        call_id, _ = self._send(request, client, async)
+        if not async:
+            return client.get_response(call_id, timeout=timeout)
         return None
 
     def json_repr(self):
@@ -36,19 +89,32 @@ class RpcRequest(object):
     def call_options(self):
         return {}
 
+    def supersede_key(self):
+        """Requests sharing a key supersede each other: once a new one is sent
+        the response of the previous one, if still pending, is discarded."""
+        return None
+
 
 class ConnectionInfoRequest(RpcRequest):
-    def __init__(self):
+    idempotent = True
+
+    def __init__(self, timeout=None):
         super(ConnectionInfoRequest, self).__init__()
+        if timeout is not None:
+            self.timeout = timeout
 
     def json_repr(self):
         return {"typehint": "ConnectionInfoReq"}
 
 
 class TypeCheckFilesReq(RpcRequest):
+    idempotent = True
+    priority = BACKGROUND
+
     def __init__(self, filenames):
         super(TypeCheckFilesReq, self).__init__()
         self.filenames = list(filenames)
+        self.timeout = TYPECHECK_TIMEOUT
 
     def json_repr(self):
         return {"typehint": "TypecheckFilesReq",
@@ -56,6 +122,8 @@ class TypeCheckFilesReq(RpcRequest):
 
 
 class ImportSuggestionsReq(RpcRequest):
+    idempotent = True
+
     def __init__(self, pos, file, word, max_results=10):
         super(ImportSuggestionsReq, self).__init__()
         self.pos = pos
@@ -75,20 +143,27 @@ class ImportSuggestionsReq(RpcRequest):
 
 
 class CompletionsReq(RpcRequest):
-    def __init__(self, point, file, contents=None, max_results=100, case_sensitive=True, reLoad=False):
+    idempotent = True
+
+    def __init__(self, point, file, contents=None, max_results=100, case_sensitive=True, reLoad=False,
+                 view_id=None, contents_in=None):
         super(CompletionsReq, self).__init__()
+        self.view_id = view_id
         self.point = point
-        self.file_info = self._file_info(file, contents)
+        self.file_info = self._file_info(file, contents, contents_in)
         self.case_sensitive = case_sensitive
         self.max_results = max_results
         self.reLoad = reLoad
         self.timeout = COMPLETION_TIMEOUT
 
-    def _file_info(self, file, contents):
-        """Message fragment for ENSIME ``fileInfo`` field, from current file."""
+    def _file_info(self, file, contents, contents_in=None):
+        """Message fragment for ENSIME ``fileInfo`` field, from current file.
+        Unsaved contents are either inline or in the file ``contents_in``."""
         file_info = {"file": file}
         if contents is not None:
             file_info.update({"contents": contents})
+        elif contents_in is not None:
+            file_info.update({"contentsIn": contents_in})
         return file_info
 
     def json_repr(self):
@@ -98,8 +173,14 @@ class CompletionsReq(RpcRequest):
                 "fileInfo": self.file_info,
                 "reload": self.reLoad}
 
+    def supersede_key(self):
+        # only the latest completions of a view are of any use
+        return None if self.view_id is None else ("CompletionsReq", self.view_id)
+
 
 class PublicSymbolSearchReq(RpcRequest):
+    idempotent = True
+
     def __init__(self, search_terms, max_results=25):
         super(PublicSymbolSearchReq, self).__init__()
         self.search_terms = search_terms
@@ -112,18 +193,23 @@ class PublicSymbolSearchReq(RpcRequest):
 
 
 class GenericAtPointReq(RpcRequest):
-    def __init__(self, file, contents, pos, what):
+    idempotent = True
+
+    def __init__(self, file, contents, pos, what, contents_in=None):
         super(GenericAtPointReq, self).__init__()
-        self.file_info = self._file_info(file, contents)
+        self.file_info = self._file_info(file, contents, contents_in)
         self.pos_tag = "range" if what == "Type" else "point"
         self.pos = pos
         self.what = what
 
-    def _file_info(self, file, contents):
-        """Message fragment for ENSIME ``fileInfo`` field, from current file."""
+    def _file_info(self, file, contents, contents_in=None):
+        """Message fragment for ENSIME ``fileInfo`` field, from current file.
+        Unsaved contents are either inline or in the file ``contents_in``."""
         file_info = {"file": file}
         if contents is not None:
             file_info.update({"contents": contents})
+        elif contents_in is not None:
+            file_info.update({"contentsIn": contents_in})
         return file_info
 
     def json_repr(self):
@@ -139,63 +225,62 @@ class GenericAtPointReq(RpcRequest):
 
 
 class TypeAtPointReq(GenericAtPointReq):
-    def __init__(self, file, contents, pos):
-        super(TypeAtPointReq, self).__init__(file, contents, pos, "Type")
+    def __init__(self, file, contents, pos, contents_in=None):
+        super(TypeAtPointReq, self).__init__(file, contents, pos, "Type", contents_in)
 
 
 class DocUriAtPointReq(GenericAtPointReq):
-    def __init__(self, file, contents, pos):
-        super(DocUriAtPointReq, self).__init__(file, contents, pos, "DocUri")
+    def __init__(self, file, contents, pos, contents_in=None):
+        super(DocUriAtPointReq, self).__init__(file, contents, pos, "DocUri", contents_in)
 
     def call_options(self):
         return {"browse": True}
 
 
 class SymbolAtPointReq(GenericAtPointReq):
-    def __init__(self, file, contents, pos):
-        super(SymbolAtPointReq, self).__init__(file, contents, pos, "Symbol")
+    def __init__(self, file, contents, pos, contents_in=None):
+        super(SymbolAtPointReq, self).__init__(file, contents, pos, "Symbol", contents_in)
 
 
 class UsesOfSymbolAtPointReq(GenericAtPointReq):
-    def __init__(self, file, contents, pos):
-        super(UsesOfSymbolAtPointReq, self).__init__(file, contents, pos, "UsesOfSymbol")
+    def __init__(self, file, contents, pos, contents_in=None):
+        super(UsesOfSymbolAtPointReq, self).__init__(file, contents, pos, "UsesOfSymbol", contents_in)
 
 
 class HierarchyOfTypeAtPointReq(GenericAtPointReq):
-    def __init__(self, file, contents, pos):
-        super(HierarchyOfTypeAtPointReq, self).__init__(file, contents, pos, "HierarchyOfType")
+    def __init__(self, file, contents, pos, contents_in=None):
+        super(HierarchyOfTypeAtPointReq, self).__init__(file, contents, pos, "HierarchyOfType", contents_in)
 
 
 # ########################## Refactor Requests ##########################
 class RefactorRequest(RpcRequest):
+
     def __init__(self):
         super(RefactorRequest, self).__init__()
 
-    def run_in(self, env, async=False):
-        call_id = self.send_refactor_request(self.json_repr(), env.client, async)
-        if not async:
-            got_response = env.client.get_response(call_id)
-            return got_response
-        return True
+    def run_in(self, env, async=False, future=False):
+        result = self._run(self.refactor_request(self.json_repr(), env.client), env, async, future)
+        return True if async and not future else result
 
-    def send_refactor_request(self, req, client, async):
-        """Send a refactor request to the Ensime server.
+    def refactor_request(self, req, client):
+        """Build a refactor request for the Ensime server.
 
         The `ref_params` field will always have a field `type`.
         """
         ref_type = req['ref_type']
         ref_params = req['ref_params']
         ref_options = req['ref_options']
+        proc_id = client.next_refactor_id()
         request = {
             "typehint": ref_type,
-            "procId": client.refactor_id,
+            "procId": proc_id,
             "params": ref_params
         }
         f = ref_params["file"]
-        client.refactorings[client.refactor_id] = f
-        client.refactor_id += 1
+        client.refactorings.maybe_sweep()
+        client.refactorings.put(proc_id, f, getattr(self, 'timeout', DEFAULT_TIMEOUT))
         request.update(ref_options)
-        return self.send_request(request, client, async)
+        return request
 
 
 class AddImportRefactorDesc(RefactorRequest):
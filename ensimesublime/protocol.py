@@ -1,13 +1,16 @@
 # coding: utf-8
 import sublime
 
+import time
 import webbrowser
 import html
 from functools import partial as bind
 
 from util import catch, Pretty
 from notes import Note
-from outgoing import AddImportRefactorDesc, TypeCheckFilesReq
+from outgoing import AddImportRefactorDesc
+from metrics import HANDLER
+from startup import CONNECTION_INFO, ANALYZER_READY, INDEXER_READY
 from patch import fromfile
 from config import feedback, gconfig
 from symbol_format import completion_to_suggest, type_to_show, file_and_line_info
@@ -24,6 +27,8 @@ class ProtocolHandler(object):
     def __init__(self):
         self.server_version = "unknown"
         self.handlers = {}
+        # bumped by each notes event, for the quiet timeout to tell if it's the last
+        self.notes_events = 0
         self.register_responses_handlers()
 
     def register_responses_handlers(self):
@@ -69,13 +74,16 @@ class ProtocolHandler(object):
             self.env.status_message(msg.format(typehint, self.server_version))
 
         if handler:
+            start = time.time()
             with catch(NotImplementedError, feature_not_supported):
                 handler(call_id, payload)
+            self.metrics.record(typehint, HANDLER, time.time() - start)
         else:
             self.env.logger.warning('Response has not been handled: %s', Pretty(payload))
 
     def handle_connection_info(self, call_id, payload):
         self.server_version = payload.get("version", "unknown")
+        self.startup.mark(CONNECTION_INFO)
         self.env.logger.info("Connected to the ensime server {} through websocket. \
 Please wait while we get the analyzer and indexer ready. Indexing files may take a while and \
 consequently the context menu commands may take longer to get enabled. You may check the server\
@@ -89,28 +97,44 @@ consequently the context menu commands may take longer to get enabled. You may c
 
     def handle_indexer_ready(self, call_id, payload):
         self.indexer_ready = True  # used to enable commands that depend on indexer
+        self.startup.mark(INDEXER_READY)
         self.env.logger.info("Indexer is ready. Context menu commands are alive! :D")
 
     def handle_analyzer_ready(self, call_id, payload):
         self.analyzer_ready = True  # used to enable commands that depend on analyzer
+        self.startup.mark(ANALYZER_READY)
         self.env.logger.info("Analyzer is ready.")
-        files = []
-        for view in self.env.window.views():
-            files.append(view.file_name())
-        TypeCheckFilesReq(files).run_in(self.env, async=True)
+        self.typechecks.add(view.file_name() for view in self.env.window.views())
 
     def handle_scala_notes(self, call_id, payload):
         self.env.notes_storage.append(map(Note, payload['notes']))
+        self.swap_notes_when_quiet()
 
     def handle_java_notes(self, call_id, payload):
         pass
 
     def handle_clear_scala_notes(self, call_id, payload):
         self.env.notes_storage.clear()
+        self.swap_notes_when_quiet()
 
     def handle_typecheck_complete(self, call_id, payload):
-        self.env.editor.redraw_all_highlights()
-        self.env.logger.info("Handled FullTypecheckCompleteEvent. Redrawing highlights.")
+        self.notes_events += 1
+        self.env.notes_storage.swap()
+        self.env.editor.request_redraw_changed()
+        self.env.logger.info("Handled FullTypecheckCompleteEvent. Redrawing changed highlights.")
+
+    def swap_notes_when_quiet(self):
+        """Show the notes collected since the last clear if no other notes
+        event arrives for `notes_quiet_timeout` ms, in case the typecheck
+        never completes. Notes added without a clear are shown that way too."""
+        self.notes_events += 1
+        event = self.notes_events
+
+        def swap_if_quiet():
+            if event == self.notes_events and self.env.notes_storage is not None:
+                self.env.notes_storage.swap()
+                self.env.editor.request_redraw_changed()
+        sublime.set_timeout(swap_if_quiet, self.env.settings.get("notes_quiet_timeout", 2000))
 
     def handle_debug_vm_error(self, call_id, payload):
         raise NotImplementedError()
@@ -126,9 +150,16 @@ consequently the context menu commands may take longer to get enabled. You may c
             self.env.error_message('No import suggestions found.')
             return
 
+        # the call options are released once this handler returns
+        call_opt = self.call_options.get(call_id)
+        if call_opt is None:
+            self.env.logger.warning('No pending request for import suggestions of call ID %s, '
+                                    'it timed out or was evicted', call_id)
+            return
+        file_name = call_opt.get('file_name')
+
         def do_refactor(choice):
             if choice > -1:
-                file_name = self.call_options[call_id].get('file_name')
                 # request is async, file is reverted when patch is received and applied
                 AddImportRefactorDesc(file_name, imports[choice]).run_in(self.env, async=True)
 
@@ -228,7 +259,7 @@ consequently the context menu commands may take longer to get enabled. You may c
         options = self.call_options.get(call_id)
         if options and options.get('browse'):
             sublime.set_timeout(bind(self._browse_doc, self.env, url), 0)
-            del self.call_options[call_id]
+            self.call_options.pop(call_id, None)
         else:
             pass
             # TODO: make this return value of a Vim function synchronously, how?
@@ -280,14 +311,18 @@ consequently the context menu commands may take longer to get enabled. You may c
             self.env.logger.warning("Couldn't parse diff_file: {}"
                                     .format(diff_file))
             return
+        file = self.refactorings.pop(payload['procedureId'], None)
+        if file is None:
+            self.env.logger.warning("No pending refactoring {}, it timed out or was evicted"
+                                    .format(payload['procedureId']))
+            return
         self.env.logger.debug("Refactoring get root from: {}"
-                              .format(self.refactorings[payload['procedureId']]))
-        root = root_as_str_from_abspath(self.refactorings[payload['procedureId']])
+                              .format(file))
+        root = root_as_str_from_abspath(file)
         self.env.logger.debug("Refactoring set root: {}"
                               .format(root))
         result = patch_set.apply(0, root)
         if result:
-            file = self.refactorings[payload['procedureId']]
             sublime.set_timeout(bind(self.env.editor.reload_file, file), 0)
             self.env.logger.info("Refactoring succeeded, patch file: {}"
                                  .format(diff_file))
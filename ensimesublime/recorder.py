@@ -0,0 +1,98 @@
+# coding: utf-8
+"""Recording of the websocket traffic with the server, and its replay.
+
+A recording is a text file with a header line followed by one line per
+frame, ``[seconds since start, direction, frame]`` in compact JSON where
+the direction is ``>`` for frames sent to the server and ``<`` for frames
+received from it. Frames are kept verbatim.
+"""
+
+import io
+import logging
+import os
+import threading
+import time
+
+import codec
+
+OUTBOUND = ">"
+INBOUND = "<"
+FORMAT_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+
+def recording_path(cache_dir, now=None):
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+    return os.path.join(cache_dir, "traffic-{}.log".format(stamp))
+
+
+class TrafficRecorder(object):
+    """Appends every frame passed to ``inbound``/``outbound`` to ``path``.
+    Safe to use from the sending and receiving threads at once."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._file = io.open(path, "a", encoding="utf-8")
+        self._write({"version": FORMAT_VERSION, "started": self._started})
+
+    def inbound(self, frame):
+        self._frame(INBOUND, frame)
+
+    def outbound(self, frame):
+        self._frame(OUTBOUND, frame)
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def _frame(self, direction, frame):
+        self._write([round(time.time() - self._started, 6), direction, frame])
+
+    def _write(self, entry):
+        line = codec.dumps(entry) + "\n"
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line)
+                self._file.flush()
+
+
+def read_recording(path):
+    """Yield the ``(offset, direction, frame)`` entries of a recording."""
+    with io.open(path, encoding="utf-8") as f:
+        for line in f:
+            entry = codec.loads(line)
+            # header lines start each recorded session
+            if isinstance(entry, list):
+                yield tuple(entry)
+
+
+def replay(path, handle, speed=1.0, sleep=time.sleep, logger=logger):
+    """Feed the frames received in a recording to ``handle(call_id, payload)``,
+    e.g. ``ProtocolHandler.handle_incoming_response``.
+
+    Frames are spaced as recorded divided by ``speed``, or passed on back to
+    back if ``speed`` is 0. A frame whose handler fails, e.g. because it
+    needs the state of a request that was never sent in this session, is
+    logged to ``logger`` and the replay goes on. Returns the number of frames
+    replayed.
+    """
+    replayed = 0
+    previous = None
+    for offset, direction, frame in read_recording(path):
+        if direction != INBOUND:
+            continue
+        if speed and previous is not None and offset > previous:
+            sleep((offset - previous) / speed)
+        previous = offset
+        message = codec.loads(frame)
+        if message.get("payload"):
+            try:
+                handle(message.get("callId"), message["payload"])
+            except Exception:
+                logger.exception("Error while replaying %s", frame)
+        replayed += 1
+    return replayed
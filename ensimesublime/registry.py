@@ -0,0 +1,111 @@
+# coding: utf-8
+
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 300
+DEFAULT_MAX_SIZE = 1000
+SWEEP_INTERVAL = 30
+
+
+class RequestRegistry(object):
+    """A dict-like store for per-request state (``call_options``, refactorings)
+    that cannot grow without bound.
+
+    Every entry gets a deadline when stored. Expired entries are dropped by
+    ``sweep()``, which ``maybe_sweep()`` runs at most every ``SWEEP_INTERVAL``
+    seconds, and when more than ``max_size`` entries are stored the oldest one
+    is evicted. Entries should still be popped as soon as their response has
+    been handled, the deadline only catches requests that never got one.
+
+    Counters for expired and evicted entries, as well as for responses dropped
+    because they arrived too late, are available from ``stats()``.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._deadlines = {}
+        self._last_sweep = time.time()
+        self.expired = 0
+        self.evicted = 0
+        self.dropped_late = 0
+
+    def put(self, key, value, ttl=None):
+        """Store ``value`` for ``ttl`` seconds (the registry's default if None)."""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            self._deadlines[key] = time.time() + (self.ttl if ttl is None else ttl)
+            while len(self._entries) > self.max_size:
+                oldest, _ = self._entries.popitem(last=False)
+                del self._deadlines[oldest]
+                self.evicted += 1
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._entries.get(key, default)
+
+    def pop(self, key, *default):
+        with self._lock:
+            self._deadlines.pop(key, None)
+            return self._entries.pop(key, *default)
+
+    def items(self):
+        """A snapshot of the stored ``(key, value)`` pairs, oldest first."""
+        with self._lock:
+            return list(self._entries.items())
+
+    def sweep(self, now=None):
+        """Drop the entries whose deadline has passed, returns how many."""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._last_sweep = now
+            expired = [key for key, deadline in self._deadlines.items() if deadline <= now]
+            for key in expired:
+                del self._entries[key]
+                del self._deadlines[key]
+            self.expired += len(expired)
+        return len(expired)
+
+    def maybe_sweep(self, now=None):
+        """Sweep if the last sweep is more than ``SWEEP_INTERVAL`` seconds old."""
+        now = time.time() if now is None else now
+        if now - self._last_sweep >= SWEEP_INTERVAL:
+            return self.sweep(now)
+        return 0
+
+    def record_late(self):
+        """Count a response that arrived after nobody wanted it any more."""
+        with self._lock:
+            self.dropped_late += 1
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries),
+                    "expired": self.expired,
+                    "evicted": self.evicted,
+                    "dropped_late": self.dropped_late}
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
+
+    def __getitem__(self, key):
+        with self._lock:
+            return self._entries[key]
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._entries[key]
+            del self._deadlines[key]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
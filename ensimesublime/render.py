@@ -0,0 +1,98 @@
+# coding: utf-8
+
+import threading
+from collections import OrderedDict
+
+
+class RenderScheduler(object):
+    """Coalesces redraw requests into one flush per frame interval.
+
+    ``request(key, render)`` can be called from any thread. The first
+    request arms a single ``set_timeout(flush, interval)``; requests made
+    until it fires are collected, and a request with the same key as a
+    pending one replaces it. The flush runs each pending render once, in
+    the order they were first requested, on the thread ``set_timeout``
+    calls back on (the UI thread with ``sublime.set_timeout``).
+
+    Args:
+        set_timeout (callable): ``set_timeout(fn, delay_ms)``.
+        interval (int): Milliseconds between flushes.
+    """
+
+    def __init__(self, set_timeout, interval=16):
+        self.set_timeout = set_timeout
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()
+        self._scheduled = False
+        self.requested = 0
+        self.rendered = 0
+        self.cancelled = 0
+        self.flushes = 0
+
+    def request(self, key, render):
+        with self._lock:
+            self.requested += 1
+            self._pending[key] = render
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.set_timeout(self.flush, self.interval)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, OrderedDict()
+            self._scheduled = False
+            self.flushes += 1
+            self.rendered += len(pending)
+        for render in pending.values():
+            render()
+
+    def cancel(self):
+        """Drop the pending renders, e.g. once the views have been cleaned up."""
+        with self._lock:
+            self.cancelled += len(self._pending)
+            self._pending.clear()
+
+    @property
+    def coalesced(self):
+        """Requests that didn't cost a render of their own."""
+        return self.requested - self.rendered - self.cancelled - len(self._pending)
+
+    def stats(self):
+        return {"requested": self.requested, "rendered": self.rendered,
+                "coalesced": self.coalesced, "cancelled": self.cancelled,
+                "flushes": self.flushes}
+
+
+class RenderedViews(object):
+    """The views drawn since they were opened.
+
+    Redraws after a typecheck only go to the views whose notes changed, so
+    a view opened since, e.g. a newly loaded file or a clone, would never be
+    drawn if the notes of its file stay the same. ``select`` picks those as
+    well. Views that were closed are forgotten on each ``select``.
+    """
+
+    def __init__(self):
+        self._ids = set()
+
+    def select(self, views, changed, file_of):
+        """The views to redraw among ``views``: those whose file, as given by
+        ``file_of(view)``, is in ``changed`` and those never drawn."""
+        self._ids &= set(view.id() for view in views)
+        selected = []
+        for view in views:
+            file_name = file_of(view)
+            if file_name is not None and (file_name in changed or view.id() not in self._ids):
+                selected.append(view)
+        return selected
+
+    def drawn(self, view):
+        return view.id() in self._ids
+
+    def rendered(self, view):
+        self._ids.add(view.id())
+
+    def clear(self):
+        self._ids.clear()
@@ -0,0 +1,98 @@
+# coding: utf-8
+
+import threading
+import time
+from collections import deque
+
+from metrics import Histogram, PERCENTILES
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+# seconds a background request holds its slot when no deadline is given
+DEFAULT_DEADLINE = 300
+
+
+class RequestScheduler(object):
+    """Sends requests to the server by priority class.
+
+    Interactive requests, those a user waits for, are sent right away.
+    Background requests (typechecks) are sent at most ``max_background`` at
+    a time, in order, so that a burst of them never queues up in front of
+    the interactive ones. A background request holds
+    its slot until ``done`` is called with its call ID, or its deadline
+    passes if its response never arrives.
+
+    The time requests spend waiting for a slot is recorded per class.
+
+    Args:
+        send (callable): Sends an encoded message, e.g. ``EnsimeClient.send``.
+        max_background (int): Background requests allowed in flight.
+    """
+
+    def __init__(self, send, max_background=2):
+        self.send = send
+        self.max_background = max_background
+        self._lock = threading.Lock()
+        self._waiting = deque()
+        self._in_flight = {}
+        self._queue_times = dict((priority, Histogram()) for priority in PRIORITIES)
+        self.expired = 0
+
+    def submit(self, call_id, msg, priority=INTERACTIVE, timeout=None):
+        """Send ``msg`` now or, for a background request, once a slot is free."""
+        now = time.time()
+        with self._lock:
+            if priority != BACKGROUND:
+                self._queue_times[INTERACTIVE].record(0.0)
+                self.send(msg)
+                return
+            self._waiting.append((call_id, msg, timeout, now))
+            self._expire(now)
+            self._drain(now)
+
+    def done(self, call_id):
+        """The request got its response, timed out or was abandoned."""
+        with self._lock:
+            if self._in_flight.pop(call_id, None) is None:
+                # abandoned before it was even sent
+                for entry in self._waiting:
+                    if entry[0] == call_id:
+                        self._waiting.remove(entry)
+                        break
+                return
+            now = time.time()
+            self._expire(now)
+            self._drain(now)
+
+    def queued(self, call_id):
+        """Whether the request is still waiting for a slot."""
+        with self._lock:
+            return any(entry[0] == call_id for entry in self._waiting)
+
+    def stats(self):
+        """Queue times per class in milliseconds, and background occupancy."""
+        with self._lock:
+            result = {"background_in_flight": len(self._in_flight),
+                      "background_waiting": len(self._waiting),
+                      "background_expired": self.expired}
+            for priority, histogram in self._queue_times.items():
+                summary = {"count": histogram.count, "max": histogram.max / 1000.0}
+                for pct in PERCENTILES:
+                    summary["p{}".format(pct)] = histogram.percentile(pct) * 1000
+                result[priority] = summary
+            return result
+
+    def _drain(self, now):
+        while self._waiting and len(self._in_flight) < self.max_background:
+            call_id, msg, timeout, queued_at = self._waiting.popleft()
+            self._in_flight[call_id] = now + (timeout or DEFAULT_DEADLINE)
+            self._queue_times[BACKGROUND].record(now - queued_at)
+            self.send(msg)
+
+    def _expire(self, now):
+        for call_id, deadline in list(self._in_flight.items()):
+            if deadline <= now:
+                del self._in_flight[call_id]
+                self.expired += 1
@@ -0,0 +1,105 @@
+# coding: utf-8
+"""Detection of the server becoming ready, and the timeline of its startup."""
+
+import socket
+import sys
+import threading
+import time
+
+from heartbeat import Backoff
+
+SPAWNED = "process spawned"
+PORT_WRITTEN = "port written"
+SOCKET_ACCEPTED = "socket accepted"
+CONNECTION_INFO = "ConnectionInfo"
+ANALYZER_READY = "AnalyzerReady"
+INDEXER_READY = "IndexerReady"
+MILESTONES = (SPAWNED, PORT_WRITTEN, SOCKET_ACCEPTED, CONNECTION_INFO,
+              ANALYZER_READY, INDEXER_READY)
+
+# seconds between readiness probes, from the first one on
+PROBE_INITIAL = 0.02
+PROBE_MAXIMUM = 0.5
+# seconds a probe waits for the server to accept its connection
+PROBE_CONNECT_TIMEOUT = 0.5
+
+
+class StartupTimeline(object):
+    """When each startup milestone was reached, logged as they happen.
+
+    Only the first time a milestone is marked counts. Offsets are relative
+    to the spawn of the process or, when the server was already running,
+    to the earliest milestone. The whole timeline is logged once the
+    indexer is ready.
+    """
+
+    def __init__(self, logger):
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._marks = {}
+
+    def mark(self, milestone, at=None):
+        with self._lock:
+            if milestone in self._marks:
+                return
+            self._marks[milestone] = time.time() if at is None else at
+            offset = self._marks[milestone] - min(self._marks.values())
+        self.logger.info("startup: %s after %.3fs", milestone, offset)
+        if milestone == INDEXER_READY:
+            self.logger.info("startup timeline: %s", self.summary())
+
+    def offsets(self):
+        """``{milestone: seconds since the start}`` of the milestones reached."""
+        with self._lock:
+            if not self._marks:
+                return {}
+            start = min(self._marks.values())
+            return dict((m, at - start) for m, at in self._marks.items())
+
+    def summary(self):
+        offsets = self.offsets()
+        return ", ".join("{} +{:.3f}s".format(m, offsets[m]) for m in MILESTONES if m in offsets)
+
+
+def accepts_connections(port, timeout=PROBE_CONNECT_TIMEOUT):
+    try:
+        s = socket.create_connection(("127.0.0.1", port), timeout)
+    except (socket.error, socket.timeout):
+        return False
+    s.close()
+    return True
+
+
+def wait_until_ready(process, timeout, timeline, sleep=time.sleep,
+                     initial=PROBE_INITIAL, maximum=PROBE_MAXIMUM):
+    """Wait for ``process`` to write its http port file and accept connections.
+
+    The port file is read until it shows up, then only the port is probed.
+    Probes back off exponentially from ``initial`` up to ``maximum``
+    seconds, starting afresh once the port is known, so a server that is
+    listening is found within tens of milliseconds.
+
+    Returns:
+        bool: Whether the server is ready, False if it died or ``timeout``
+        seconds passed.
+    """
+    deadline = time.time() + timeout
+    delays = iter(Backoff(initial, 2, maximum, sys.maxsize))
+    port = None
+    while process.is_running():
+        if port is None:
+            try:
+                port = process.http_port()
+            except (IOError, OSError, ValueError):
+                pass
+            else:
+                timeline.mark(PORT_WRITTEN)
+                delays = iter(Backoff(initial, 2, maximum, sys.maxsize))
+        if port is not None and accepts_connections(port):
+            timeline.mark(SOCKET_ACCEPTED)
+            return True
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return False
+        sleep(min(next(delays), remaining))
+    return False
@@ -0,0 +1,191 @@
+# coding: utf-8
+
+import select
+import socket
+import threading
+import time
+from queue import Queue
+from threading import Thread
+
+import websocket
+
+from util import catch
+from wakeup import Wakeup
+
+ENGINE_THREADS = "threads"
+ENGINE_ASYNCIO = "asyncio"
+
+
+def create_transport(engine, waiters, on_message, on_error, on_send_error, logger):
+    """Build the transport selected by the ``transport_engine`` setting.
+
+    Falls back to the threaded transport when asyncio isn't available, which
+    is the case for the Python 3.3 bundled with Sublime Text 3.
+    """
+    if engine == ENGINE_ASYNCIO:
+        from aio import AsyncioTransport, asyncio
+        if asyncio is not None:
+            return AsyncioTransport(waiters, on_message, on_error, on_send_error, logger)
+        logger.warning("asyncio is not available, falling back to the threaded transport")
+    elif engine != ENGINE_THREADS:
+        logger.warning("Unknown transport engine %s, using the threaded transport", engine)
+    return ThreadedTransport(waiters, on_message, on_error, on_send_error, logger)
+
+
+class SendMetrics(object):
+    """Outbound queue depth and the time messages spend between being handed
+    to ``send`` and being written to the socket."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.sent = 0
+        self.failed = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def enqueued(self):
+        with self._lock:
+            self.pending += 1
+        return time.time()
+
+    def done(self, enqueued_at, ok=True):
+        latency = time.time() - enqueued_at
+        with self._lock:
+            self.pending -= 1
+            if ok:
+                self.sent += 1
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+            else:
+                self.failed += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {"queue_depth": self.pending,
+                    "sent": self.sent,
+                    "failed": self.failed,
+                    "send_latency_avg": self.total_latency / self.sent if self.sent else 0.0,
+                    "send_latency_max": self.max_latency}
+
+
+class ThreadedTransport(object):
+    """The websocket connection to an ENSIME server, served by its own threads.
+
+    ``send`` only enqueues the message, a writer thread drains the queue onto
+    the socket so callers on the UI thread never block on it. Messages are
+    received on another background thread which passes every text frame to
+    ``on_message``. That thread blocks on the websocket (or on ``self.wakeup``
+    alone while there is no connection) so it costs nothing while the server
+    is idle, waking up only to time out pending futures of ``waiters`` when
+    their deadline passes.
+
+    Args:
+        waiters (ResponseWaiters): Pending responses, expired by this transport.
+        on_message (callable): Called with each received frame.
+        on_error (callable): Called with an error message when the connection breaks.
+        on_send_error (callable): Called with the message and the error message
+            when a message could not be written, on the writer thread.
+        logger (logging.Logger): The environment's logger.
+    """
+
+    def __init__(self, waiters, on_message, on_error, on_send_error, logger):
+        self.waiters = waiters
+        self.on_message = on_message
+        self.on_error = on_error
+        self.on_send_error = on_send_error
+        self.logger = logger
+        self.ws = None
+        self.running = True
+        self.metrics = SendMetrics()
+        self.outbox = Queue()
+
+        # interrupts the poller's select, e.g. on connection or teardown
+        self.wakeup = Wakeup()
+        waiters.wakeup = self.wakeup
+        thread = Thread(name='queue-poller', target=self.queue_poll)
+        thread.daemon = True
+        thread.start()
+        writer = Thread(name='ws-writer', target=self.drain_outbox)
+        writer.daemon = True
+        writer.start()
+
+    @property
+    def connected(self):
+        return self.ws is not None
+
+    def connect(self, url, options):
+        """Open the websocket, raises ``websocket.WebSocketException`` on failure."""
+        self.ws = websocket.create_connection(url, **options)
+        self.wakeup.wake()
+
+    def send(self, msg):
+        """Queue a text frame for the writer thread, returns immediately."""
+        self.outbox.put((msg, self.metrics.enqueued()))
+
+    def stats(self):
+        return self.metrics.snapshot()
+
+    def disconnect(self):
+        """Forget the current websocket, the poller then blocks on `self.wakeup`."""
+        ws, self.ws = self.ws, None
+        if ws is not None:
+            with catch(Exception):
+                ws.close(timeout=0)
+
+    def close(self):
+        """Stop the receiving and writing threads and drop the connection."""
+        self.running = False
+        self.wakeup.wake()
+        self.outbox.put(None)
+
+    def drain_outbox(self):
+        """Write queued messages to the websocket until closed."""
+        while True:
+            item = self.outbox.get()
+            if item is None:
+                break
+            msg, enqueued_at = item
+            ws = self.ws
+            if ws is None:
+                self.logger.debug('not connected, dropping outgoing message')
+                self.metrics.done(enqueued_at, ok=False)
+                continue
+            try:
+                ws.send(msg)
+            except (websocket.WebSocketException, socket.error) as e:
+                self.metrics.done(enqueued_at, ok=False)
+                self.on_send_error(msg, str(e))
+            else:
+                self.metrics.done(enqueued_at)
+
+    def queue_poll(self):
+        """Dispatch new messages as they arrive."""
+        def log_and_close(msg):
+            # unless the socket was dropped on purpose meanwhile
+            if self.ws is ws:
+                self.disconnect()
+                self.on_error(msg)
+
+        while self.running:
+            ws = self.ws
+            sources = [self.wakeup] if ws is None else [self.wakeup, ws]
+            try:
+                readable, _, _ = select.select(sources, [], [], self.waiters.expire())
+            except (select.error, OSError, ValueError, AttributeError) as e:
+                # the websocket was closed under our feet
+                log_and_close(str(e))
+                continue
+
+            if self.wakeup in readable:
+                self.wakeup.drain()
+            if ws is None or ws not in readable:
+                continue
+
+            with catch(websocket.WebSocketException, log_and_close):
+                result = ws.recv()
+                if result:
+                    self.on_message(result)
+
+        self.disconnect()
+        self.wakeup.close()
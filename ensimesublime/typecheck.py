@@ -0,0 +1,75 @@
+# coding: utf-8
+
+import threading
+from collections import OrderedDict
+
+from util import Util
+
+
+class TypecheckScheduler(object):
+    """Collects files to typecheck and sends them to the server in batches.
+
+    Files added within ``delay`` milliseconds of each other go out as a single
+    request, de-duplicated and with the file of the active view first. Only
+    Scala and Java files are kept, scratch buffers (no file name) are dropped.
+    At most one batch is in flight: files added meanwhile wait for the next
+    one, which is sent once the server answered the current batch.
+
+    Args:
+        send (callable): Sends a list of files, returns a future for the response.
+        set_timeout (callable): ``sublime.set_timeout`` or alike, ``(fn, ms)``.
+        active_file (callable): Returns the file name of the active view.
+        delay (int): Debounce window in milliseconds.
+    """
+
+    def __init__(self, send, set_timeout, active_file, delay=300):
+        self.send = send
+        self.set_timeout = set_timeout
+        self.active_file = active_file
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()
+        self._scheduled = False
+        self._in_flight = False
+
+    def add(self, files):
+        """Queue files for the next batch."""
+        files = [f for f in files if f and (Util.is_scala(f) or Util.is_java(f))]
+        if not files:
+            return
+        with self._lock:
+            for f in files:
+                self._pending[f] = True
+            schedule = not (self._scheduled or self._in_flight)
+            if schedule:
+                self._scheduled = True
+        if schedule:
+            self.set_timeout(self._flush, self.delay)
+
+    def _flush(self):
+        with self._lock:
+            self._scheduled = False
+            if self._in_flight or not self._pending:
+                return
+            files = list(self._pending)
+            self._pending.clear()
+            self._in_flight = True
+
+        active = self.active_file()
+        if active in files:
+            files.remove(active)
+            files.insert(0, active)
+        response = self.send(files)
+        if response is None:
+            self._done(None)
+        else:
+            response.add_done_callback(self._done)
+
+    def _done(self, response):
+        with self._lock:
+            self._in_flight = False
+            schedule = bool(self._pending) and not self._scheduled
+            if schedule:
+                self._scheduled = True
+        if schedule:
+            self.set_timeout(self._flush, self.delay)
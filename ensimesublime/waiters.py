@@ -0,0 +1,215 @@
+# coding: utf-8
+
+import threading
+import time
+from concurrent.futures import Future, TimeoutError, CancelledError
+
+from registry import RequestRegistry, DEFAULT_TTL, DEFAULT_MAX_SIZE
+
+
+class Superseded(Exception):
+    """A newer request took the place of this one before it was answered."""
+
+
+class RpcFuture(Future):
+    """The eventual response payload of a single request.
+
+    This is a plain :class:`concurrent.futures.Future`: use ``result(timeout)``,
+    ``add_done_callback`` and ``cancel()``. Callbacks run on the thread that
+    receives from the websocket, so anything touching the UI has to go through
+    ``sublime.set_timeout`` just like the protocol handlers do.
+    """
+
+    def __init__(self, call_id):
+        super(RpcFuture, self).__init__()
+        self.call_id = call_id
+
+
+class ResponseWaiters(object):
+    """Registry of pending responses, keyed by ``callId``.
+
+    A future must be registered with ``expect()`` *before* the request goes
+    out on the wire, otherwise a fast server may answer before anyone is
+    listening. The receiving thread hands decoded payloads to ``deliver()``,
+    which resolves the future and so wakes any caller blocked in ``wait()``
+    immediately instead of letting it find the response on its next polling
+    round.
+
+    Futures registered with a timeout fail with ``TimeoutError`` once
+    ``expire()`` sees their deadline pass; ``wakeup`` (if given) is poked
+    whenever a new deadline becomes the earliest one, so that the thread
+    calling ``expire()`` can sleep exactly until ``next_deadline()``.
+    """
+
+    def __init__(self, wakeup=None):
+        self._lock = threading.Lock()
+        self._futures = {}
+        self._deadlines = {}
+        self.wakeup = wakeup
+
+    def expect(self, call_id, timeout=None):
+        """Register interest in the response for ``call_id``.
+
+        Returns the :class:`RpcFuture` that will hold its payload.
+        """
+        future = RpcFuture(call_id)
+        with self._lock:
+            self._futures[call_id] = future
+            if timeout is not None:
+                deadline = time.time() + timeout
+                earliest = not self._deadlines or deadline < min(self._deadlines.values())
+                self._deadlines[call_id] = deadline
+            else:
+                earliest = False
+        # a resolved future stays until collected by `wait` or `discard`,
+        # one that was cancelled or timed out is dropped right away
+        future.add_done_callback(lambda f: f.cancelled() and self.discard(call_id))
+        if earliest and self.wakeup is not None:
+            self.wakeup.wake()
+        return future
+
+    def future(self, call_id):
+        """The future registered for ``call_id``, or None."""
+        with self._lock:
+            return self._futures.get(call_id)
+
+    def deliver(self, call_id, payload):
+        """Resolve the future for ``call_id`` with ``payload``.
+
+        Returns False if nobody is waiting for ``call_id`` any more (the
+        caller timed out or cancelled), in which case the payload is not kept.
+        """
+        with self._lock:
+            self._deadlines.pop(call_id, None)
+            future = self._futures.get(call_id)
+        if future is None or future.done() or not future.set_running_or_notify_cancel():
+            return False
+        future.set_result(payload)
+        return True
+
+    def wait(self, call_id, timeout):
+        """Block until the payload for ``call_id`` arrives or ``timeout``
+        seconds elapse. Returns the payload or None on timeout, raises
+        ``Superseded`` if a newer request took its place meanwhile.
+
+        The future is discarded either way, so a late response is refused
+        by ``deliver()``.
+        """
+        future = self.future(call_id)
+        if future is None:
+            return None
+        try:
+            return future.result(timeout)
+        except (TimeoutError, CancelledError):
+            return None
+        finally:
+            self.discard(call_id)
+
+    def discard(self, call_id):
+        """Unregister ``call_id``, cancelling its future if still pending.
+        Must be called once the payload of a resolved future was consumed."""
+        future = self._pop(call_id)
+        if future is not None:
+            future.cancel()
+
+    def supersede(self, call_id):
+        """Fail the future for ``call_id`` with ``Superseded``, waking its caller."""
+        future = self._pop(call_id)
+        if future is not None and future.set_running_or_notify_cancel():
+            future.set_exception(Superseded("call ID {} was superseded".format(call_id)))
+
+    def clear(self):
+        """Cancel every pending future, e.g. when the connection goes away."""
+        with self._lock:
+            call_ids = list(self._futures)
+        for call_id in call_ids:
+            self.discard(call_id)
+
+    def expire(self, now=None):
+        """Fail the futures whose deadline has passed with ``TimeoutError``.
+
+        Returns the number of seconds until the next deadline, or None if
+        there is none.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = [call_id for call_id, deadline in self._deadlines.items()
+                       if deadline <= now]
+        for call_id in expired:
+            future = self._pop(call_id)
+            if future is not None and future.set_running_or_notify_cancel():
+                future.set_exception(TimeoutError("no reply for call ID {}".format(call_id)))
+        deadline = self.next_deadline()
+        return None if deadline is None else max(0, deadline - now)
+
+    def next_deadline(self):
+        with self._lock:
+            return min(self._deadlines.values()) if self._deadlines else None
+
+    def _pop(self, call_id):
+        with self._lock:
+            self._deadlines.pop(call_id, None)
+            return self._futures.pop(call_id, None)
+
+    def __contains__(self, call_id):
+        with self._lock:
+            return call_id in self._futures
+
+    def __len__(self):
+        with self._lock:
+            return len(self._futures)
+
+
+class RequestGenerations(object):
+    """Tracks the newest request per key, e.g. the completion request of a view.
+
+    Every ``begin()`` for a key starts a new generation and makes the request
+    of the previous one obsolete if it is still in flight. ``end()`` tells
+    whether a response that just arrived still matters. Obsolete requests
+    whose response never arrives are forgotten like any other request
+    state, after ``ttl`` seconds or beyond ``max_size`` of them.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE):
+        self._lock = threading.Lock()
+        self._generations = {}
+        self._latest = {}
+        self._keys = {}
+        self._obsolete = RequestRegistry(ttl, max_size)
+
+    def begin(self, key, call_id):
+        """Make ``call_id`` the current request for ``key``.
+
+        Returns the call ID it supersedes, or None.
+        """
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            stale = self._latest.get(key)
+            if stale is not None:
+                del self._keys[stale]
+                self._obsolete.maybe_sweep()
+                self._obsolete.put(stale, key)
+            self._latest[key] = call_id
+            self._keys[call_id] = key
+        return stale
+
+    def end(self, call_id):
+        """Forget ``call_id`` once its response arrived.
+
+        Returns False if it was superseded and the response must be dropped.
+        """
+        with self._lock:
+            if self._obsolete.pop(call_id, None) is not None:
+                return False
+            key = self._keys.pop(call_id, None)
+            if key is not None and self._latest.get(key) == call_id:
+                del self._latest[key]
+            return True
+
+    def generation(self, key):
+        with self._lock:
+            return self._generations.get(key, 0)
+
+    def stats(self):
+        """Counters of the obsolete requests still awaiting a response."""
+        return self._obsolete.stats()
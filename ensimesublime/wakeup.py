@@ -0,0 +1,50 @@
+# coding: utf-8
+
+import socket
+
+
+class Wakeup(object):
+    """A self-pipe that can be passed to ``select.select`` next to a socket,
+    so that a thread blocked on the socket can be woken up from elsewhere.
+
+    ``os.pipe`` descriptors can't be selected on Windows, hence a connected
+    pair of sockets (a loopback connection where ``socketpair`` is missing).
+    """
+
+    def __init__(self):
+        if hasattr(socket, "socketpair"):
+            self._reader, self._writer = socket.socketpair()
+        else:
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                listener.bind(("127.0.0.1", 0))
+                listener.listen(1)
+                self._writer = socket.create_connection(listener.getsockname())
+                self._reader, _ = listener.accept()
+            finally:
+                listener.close()
+        self._reader.setblocking(False)
+        self._writer.setblocking(False)
+
+    def fileno(self):
+        return self._reader.fileno()
+
+    def wake(self):
+        """Make the reading end readable. Safe to call from any thread."""
+        try:
+            self._writer.send(b"\0")
+        except socket.error:
+            # buffer full (already awake) or closed
+            pass
+
+    def drain(self):
+        """Consume pending wake-ups so the next ``select`` blocks again."""
+        try:
+            while self._reader.recv(4096):
+                pass
+        except socket.error:
+            pass
+
+    def close(self):
+        self._reader.close()
+        self._writer.close()
@@ -1,6 +1,9 @@
 import os
+import socket
 import sys
 
+import pytest
+
 
 # pytest expects the project modules to be importable from whereever you run
 # it, preferring that you do `pip install --editable .` -- we don't want to be
@@ -10,3 +13,43 @@ parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, parent)
 sys.path += [os.path.join(parent, "dependencies"),
              os.path.join(parent, "ensimesublime")]
+
+
+class ManualTimer(object):
+    """Stands in for ``sublime.set_timeout``, runs callbacks on demand."""
+
+    def __init__(self):
+        self.callbacks = []
+
+    def __call__(self, fn, delay):
+        self.callbacks.append(fn)
+
+    def fire(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for fn in callbacks:
+            fn()
+
+
+@pytest.fixture
+def timer():
+    return ManualTimer()
+
+
+@pytest.fixture
+def closed_port():
+    """A local port nothing listens on."""
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+@pytest.fixture
+def listening_port():
+    """A local port that accepts connections but never answers."""
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    s.listen(1)
+    yield s.getsockname()[1]
+    s.close()
@@ -0,0 +1,39 @@
+# coding: utf-8
+
+import os
+
+import pytest
+
+from websocket import ABNF
+
+
+def reference_mask(mask_key, data):
+    return bytes(bytearray(b ^ mask_key[i % 4] for i, b in enumerate(bytearray(data))))
+
+
+@pytest.mark.parametrize("length", [0, 1, 3, 4, 5, 127, 1024, 65537])
+def test_matches_reference(length):
+    mask_key = os.urandom(4)
+    data = os.urandom(length)
+    assert ABNF.mask(mask_key, data) == reference_mask(mask_key, data)
+
+
+def test_unmask_roundtrip():
+    mask_key = b"\xff\x00\x80\x01"
+    data = u"val größe = 1\n".encode("utf-8") * 100
+    masked = ABNF.mask(mask_key, data)
+    assert masked != data
+    assert ABNF.mask(mask_key, masked) == data
+
+
+def test_text_and_empty_inputs():
+    assert ABNF.mask(b"abcd", None) == b""
+    assert ABNF.mask(u"abcd", u"abcd") == b"\x00\x00\x00\x00"
+
+
+def test_frame_format_masks_payload():
+    frame = ABNF.create_frame(u"hello", ABNF.OPCODE_TEXT)
+    frame.get_mask_key = lambda n: b"\x01\x02\x03\x04"
+    formatted = frame.format()
+    assert formatted[-9:-5] == b"\x01\x02\x03\x04"
+    assert ABNF.mask(b"\x01\x02\x03\x04", formatted[-5:]) == b"hello"
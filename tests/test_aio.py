@@ -0,0 +1,76 @@
+# coding: utf-8
+
+import base64
+import hashlib
+import struct
+
+import pytest
+
+from aio import JerkyProtocol, WS_MAGIC
+
+
+class RecordingTransport(object):
+    def __init__(self):
+        self.written = []
+        self.closed = False
+
+    def write(self, data):
+        self.written.append(data)
+
+    def close(self):
+        self.closed = True
+
+
+def server_frame(opcode, payload, fin=True):
+    assert len(payload) < 126
+    return struct.pack("!BB", (0x80 if fin else 0) | opcode, len(payload)) + payload
+
+
+@pytest.fixture
+def connected():
+    received, lost = [], []
+    protocol = JerkyProtocol("127.0.0.1", 1234, "/websocket", ["jerky"],
+                             received.append, lambda p, msg: lost.append(msg))
+    transport = RecordingTransport()
+    protocol.connection_made(transport)
+    accept = base64.b64encode(hashlib.sha1(protocol.key + WS_MAGIC).digest())
+    protocol.data_received(b"HTTP/1.1 101 Switching Protocols\r\n"
+                           b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+    return protocol, transport, received, lost
+
+
+def test_handshake_request_and_response(connected):
+    protocol, transport, _, _ = connected
+    request = transport.written[0]
+    assert request.startswith(b"GET /websocket HTTP/1.1\r\n")
+    assert b"Sec-WebSocket-Protocol: jerky\r\n" in request
+    assert protocol.handshake.result(timeout=0)
+
+
+def test_bad_handshake_fails():
+    protocol = JerkyProtocol("127.0.0.1", 1234, "/", [], None, None)
+    protocol.connection_made(RecordingTransport())
+    protocol.data_received(b"HTTP/1.1 404 Not Found\r\n\r\n")
+    with pytest.raises(Exception) as excinfo:
+        protocol.handshake.result(timeout=0)
+    assert "404" in str(excinfo.value)
+
+
+def test_reassembles_frames_split_across_reads(connected):
+    protocol, _, received, _ = connected
+    data = (server_frame(0x1, b'{"callId"', fin=False) +
+            server_frame(0x0, b': 1}') +
+            server_frame(0x1, b'{}'))
+    for i in range(0, len(data), 3):
+        protocol.data_received(data[i:i + 3])
+    assert received == ['{"callId": 1}', '{}']
+
+
+def test_answers_ping_and_reports_close(connected):
+    protocol, transport, _, lost = connected
+    protocol.data_received(server_frame(0x9, b"hi") + server_frame(0x8, b"\x03\xe8"))
+    pong, close = transport.written[1:]
+    assert pong[0] == 0x80 | 0xa
+    assert close[0] == 0x80 | 0x8
+    assert transport.closed
+    assert lost == ["Connection closed by the server."]
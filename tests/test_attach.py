@@ -0,0 +1,88 @@
+# coding: utf-8
+
+import json
+import os
+
+import pytest
+
+from errors import LaunchError
+from launcher import attach, pid_alive, answers_connection_info, server_files, EnsimeProcess
+
+
+def dead_pid():
+    pid = 2 ** 22 + 1
+    while pid_alive(pid):
+        pid += 1
+    return pid
+
+
+def write_server_files(cache_dir, pid, port):
+    for path, contents in zip(server_files(str(cache_dir)), (pid, port, port)):
+        with open(path, "w") as f:
+            f.write(str(contents))
+
+
+def test_pid_alive():
+    assert pid_alive(os.getpid())
+    assert not pid_alive(dead_pid())
+
+
+def test_nothing_to_attach_to(tmpdir):
+    assert attach(str(tmpdir)) is None
+
+
+def test_files_of_dead_server_are_removed(tmpdir, closed_port):
+    write_server_files(tmpdir, dead_pid(), closed_port)
+    assert attach(str(tmpdir)) is None
+    assert not any(os.path.exists(path) for path in server_files(str(tmpdir)))
+
+
+def test_pid_reused_by_another_process(tmpdir, closed_port):
+    write_server_files(tmpdir, os.getpid(), closed_port)
+    assert attach(str(tmpdir)) is None
+    assert not any(os.path.exists(path) for path in server_files(str(tmpdir)))
+
+
+def test_busy_server_is_not_replaced(tmpdir, listening_port):
+    write_server_files(tmpdir, os.getpid(), listening_port)
+    with pytest.raises(LaunchError):
+        attach(str(tmpdir), timeout=0.2)
+    assert all(os.path.exists(path) for path in server_files(str(tmpdir)))
+
+
+def test_answers_connection_info_needs_a_server(closed_port):
+    assert not answers_connection_info(closed_port, timeout=0.5)
+
+
+class ServerSocket(object):
+    def __init__(self, frames):
+        self.frames = list(frames)
+        self.sent = []
+
+    def send(self, msg):
+        self.sent.append(json.loads(msg))
+
+    def settimeout(self, timeout):
+        pass
+
+    def recv(self):
+        return json.dumps(self.frames.pop(0))
+
+    def close(self):
+        pass
+
+
+def test_answers_connection_info_skips_other_frames():
+    ws = ServerSocket([{"payload": {"typehint": "IndexerReadyEvent"}},
+                       {"callId": 0, "payload": {"typehint": "ConnectionInfo"}}])
+    assert answers_connection_info(1, connect=lambda url, **options: ws)
+    assert ws.sent[0]["callId"] == 0
+
+
+def test_attached_process_is_known_by_pid(tmpdir):
+    process = EnsimeProcess(str(tmpdir), None, lambda: None, pid=os.getpid())
+    assert process.attached
+    assert process.started_at is None
+    assert process.is_running()
+    process.detach()
+    assert not process.aborted()
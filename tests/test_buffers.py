@@ -0,0 +1,42 @@
+# coding: utf-8
+
+import io
+import os
+
+from buffers import BufferFiles
+
+
+def read(path):
+    with io.open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_rewrites_only_on_change(tmpdir):
+    files = BufferFiles(str(tmpdir.join("buffers")))
+    calls = []
+
+    def contents():
+        calls.append(1)
+        return u"object Größe {}\n"
+
+    path = files.write(1, "/src/Foo.scala", 3, contents)
+    assert path.endswith("view-1.scala")
+    assert read(path) == u"object Größe {}\n"
+    assert files.write(1, "/src/Foo.scala", 3, contents) == path
+    assert len(calls) == 1
+
+    files.write(1, "/src/Foo.scala", 4, lambda: u"object Foo\n")
+    assert read(path) == u"object Foo\n"
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_discard_and_clear(tmpdir):
+    files = BufferFiles(str(tmpdir))
+    first = files.write(1, "/src/A.scala", 1, lambda: u"a")
+    second = files.write(2, "/src/B.java", 1, lambda: u"b")
+    files.discard(1)
+    assert not os.path.exists(first)
+    assert os.path.exists(second)
+    files.discard(1)
+    files.clear()
+    assert not os.path.exists(second)
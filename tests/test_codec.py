@@ -0,0 +1,39 @@
+# coding: utf-8
+
+import json
+
+import codec
+
+
+def test_dumps_is_compact_utf8():
+    text = codec.dumps({"file": "/src/Ünïcode.scala", "contents": "val π = 3.14"})
+    assert "Ünïcode" in text and "π" in text
+    assert ", " not in text and ": " not in text
+    assert json.loads(text) == {"file": "/src/Ünïcode.scala", "contents": "val π = 3.14"}
+
+
+def test_loads_roundtrip():
+    message = {"callId": 3, "payload": {"typehint": "CompletionInfoList", "completions": []}}
+    assert codec.loads(codec.dumps(message)) == message
+
+
+def test_peek_response():
+    frame = '{"callId":42,"payload":{"typehint":"CompletionInfoList","prefix":"fo"}}'
+    assert codec.peek(frame) == (42, "CompletionInfoList")
+
+
+def test_peek_event():
+    frame = '{ "payload" : { "typehint" : "NewScalaNotesEvent", "notes": [] } }'
+    assert codec.peek(frame) == (None, "NewScalaNotesEvent")
+
+
+def test_peek_unknown_layout():
+    frame = json.dumps({"payload": {"prefix": "fo", "typehint": "CompletionInfoList"},
+                        "callId": 42}, sort_keys=True)
+    assert codec.peek(frame) == (None, None)
+    assert codec.peek('not json') == (None, None)
+
+
+def test_peek_misses_call_id_after_payload():
+    frame = '{"payload":{"typehint":"CompletionInfoList"},"callId":42}'
+    assert codec.peek(frame) == (None, "CompletionInfoList")
@@ -0,0 +1,53 @@
+# coding: utf-8
+
+import pytest
+
+from heartbeat import Backoff, Heartbeat
+
+
+def test_backoff_grows_up_to_maximum():
+    assert list(Backoff(initial=1, factor=2, maximum=5, attempts=5)) == [1, 2, 4, 5, 5]
+
+
+@pytest.fixture
+def answers():
+    return []
+
+
+@pytest.fixture
+def lost():
+    return []
+
+
+@pytest.fixture
+def heartbeat(answers, lost):
+    return Heartbeat(lambda: answers.pop(0), lambda: True, lambda: lost.append(True),
+                     interval=0, misses=2)
+
+
+def test_tracks_latency(heartbeat, answers, lost):
+    answers.extend([True, True])
+    heartbeat.beat()
+    heartbeat.beat()
+    stats = heartbeat.stats()
+    assert stats["beats"] == 2
+    assert stats["missed"] == 0
+    assert stats["latency_last"] is not None
+    assert stats["latency_max"] >= stats["latency_avg"] >= 0
+    assert not lost
+
+
+def test_reports_consecutive_misses(heartbeat, answers, lost):
+    answers.extend([False, True, False, False, False])
+    for _ in range(5):
+        heartbeat.beat()
+    assert len(lost) == 1
+    assert heartbeat.stats()["missed"] == 4
+    assert heartbeat.consecutive_misses == 1
+
+
+def test_inactive_does_not_probe(heartbeat):
+    heartbeat.active = lambda: False
+    heartbeat.beat()
+    heartbeat.start()  # interval 0 disables the thread
+    assert heartbeat.stats()["beats"] == 0
@@ -0,0 +1,54 @@
+# coding: utf-8
+
+from hibernation import HibernationManager
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_idle_servers():
+    clock = Clock()
+    manager = HibernationManager(idle_timeout=60, clock=clock)
+    assert manager.started("a") == []
+    assert manager.started("b") == []
+    clock.now += 30
+    manager.touch("b")
+    clock.now += 30
+    assert manager.idle() == ["a"]
+    manager.stopped("a", hibernated=True)
+    assert manager.idle() == []
+    assert manager.stats() == {"running": 1, "hibernated": 1}
+
+
+def test_touch_ignores_stopped_servers():
+    manager = HibernationManager(idle_timeout=60)
+    manager.touch("a")
+    assert not manager.is_running("a")
+
+
+def test_budget_evicts_least_recently_active():
+    clock = Clock()
+    manager = HibernationManager(max_servers=2, clock=clock)
+    for key in ("a", "b"):
+        clock.now += 1
+        manager.started(key)
+    clock.now += 1
+    manager.touch("a")
+    clock.now += 1
+    assert manager.started("c") == ["b"]
+    manager.stopped("b", hibernated=True)
+    manager.configure(idle_timeout=0, max_servers=1)
+    clock.now += 1
+    assert manager.started("b") == ["a", "c"]
+
+
+def test_limits_disabled_by_default():
+    manager = HibernationManager(clock=Clock())
+    for key in range(10):
+        assert manager.started(key) == []
+    assert manager.idle() == []
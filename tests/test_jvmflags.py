@@ -0,0 +1,78 @@
+# coding: utf-8
+
+from config import ProjectConfig
+from jvmflags import ProjectSize, project_size, derive_flags, merge_flags, tuned_java_flags
+
+MB = 1024 * 1024
+
+
+def jar(tmpdir, name, mb):
+    path = tmpdir.join(name)
+    with open(path.strpath, "wb") as f:
+        f.truncate(mb * MB)
+    return path.strpath
+
+
+def dot_ensime(tmpdir, subprojects, java_flags=()):
+    """Write a ``.ensime`` with ``subprojects`` as ``(source roots, jars)`` pairs."""
+    def strings(items):
+        return "(" + " ".join('"{}"'.format(item) for item in items) + ")"
+    modules = " ".join("(:name \"m{}\" :source-roots {} :compile-deps {})"
+                       .format(i, strings(roots), strings(jars))
+                       for i, (roots, jars) in enumerate(subprojects))
+    path = tmpdir.join(".ensime")
+    path.write('(:name "synthetic" :java-flags {} :subprojects ({}))'
+               .format(strings(java_flags), modules))
+    return ProjectConfig(path.strpath)
+
+
+def test_measures_project(tmpdir):
+    shared = jar(tmpdir, "scala-library.jar", 6)
+    config = dot_ensime(tmpdir, [(["/p/a/src/main/scala", "/p/a/src/test/scala"],
+                                  [shared, jar(tmpdir, "a.jar", 10)]),
+                                 (["/p/b/src/main/scala"],
+                                  [shared, tmpdir.join("missing.jar").strpath])])
+    assert project_size(config) == ProjectSize(subprojects=2, source_roots=3, jars_mb=16)
+
+
+def test_small_project_gets_a_small_heap(tmpdir):
+    config = dot_ensime(tmpdir, [(["/p/src/main/scala"], [jar(tmpdir, "lib.jar", 20)])])
+    flags, applied, size = tuned_java_flags(config)
+    assert flags == applied == ["-Xms256m", "-Xmx1024m", "-XX:+UseParallelGC",
+                                "-XX:MaxMetaspaceSize=320m"]
+
+
+def test_large_project_gets_g1_and_more_memory(tmpdir):
+    config = dot_ensime(tmpdir, [(["/p/m{}/src/main/scala".format(i)],
+                                  [jar(tmpdir, "lib{}.jar".format(i), 40)])
+                                 for i in range(30)])
+    flags, applied, size = tuned_java_flags(config)
+    assert size == ProjectSize(30, 30, 1200)
+    assert flags == ["-Xms1280m", "-Xmx5120m", "-XX:+UseG1GC", "-XX:MaxMetaspaceSize=896m"]
+
+
+def test_user_flags_take_precedence(tmpdir):
+    config = dot_ensime(tmpdir, [(["/p/src"], [])],
+                        java_flags=["-Xmx3g", "-XX:+UseConcMarkSweepGC", "-Dfoo=bar"])
+    flags, applied, size = tuned_java_flags(config)
+    assert applied == ["-XX:MaxMetaspaceSize=256m"]
+    assert flags == applied + ["-Xmx3g", "-XX:+UseConcMarkSweepGC", "-Dfoo=bar"]
+
+
+def test_user_heap_flag_drops_the_derived_heap_sizes():
+    derived = derive_flags(ProjectSize(30, 30, 1200))
+    assert "-Xms1280m" in derived
+    flags, applied = merge_flags(["-Xmx1g"], derived)
+    assert flags == ["-XX:+UseG1GC", "-XX:MaxMetaspaceSize=896m", "-Xmx1g"]
+    flags, applied = merge_flags(["-Xms2g"], derived)
+    assert not any(flag.startswith("-Xm") for flag in applied)
+
+
+def test_merge_drops_empty_user_flags():
+    flags, applied = merge_flags(["", "-XX:MaxMetaspaceSize=1g"], ["-Xmx1024m", "-XX:MaxMetaspaceSize=256m"])
+    assert flags == ["-Xmx1024m", "-XX:MaxMetaspaceSize=1g"]
+    assert applied == ["-Xmx1024m"]
+
+
+def test_heap_is_capped():
+    assert "-Xmx6144m" in derive_flags(ProjectSize(500, 5000, 100000))
@@ -0,0 +1,42 @@
+# coding: utf-8
+
+import pytest
+
+from metrics import Histogram, RequestMetrics, SEND, HANDLER, TIMEOUTS
+
+
+def test_histogram_percentiles_within_precision():
+    histogram = Histogram()
+    for ms in range(1, 1001):
+        histogram.record(ms / 1000.0)
+    assert histogram.count == 1000
+    for pct, expected in ((50, 0.5), (95, 0.95), (99, 0.99)):
+        assert histogram.percentile(pct) == pytest.approx(expected, rel=1.0 / 16)
+    assert histogram.percentile(100) == pytest.approx(1.0)
+    assert histogram.mean() == pytest.approx(0.5005)
+
+
+def test_histogram_small_values_are_exact():
+    histogram = Histogram()
+    for us in (1, 2, 3, 31):
+        histogram.record(us / 1000000.0)
+    assert histogram.percentile(50) == pytest.approx(2e-6)
+    assert histogram.percentile(100) == pytest.approx(31e-6)
+    assert Histogram().percentile(99) == 0.0
+
+
+def test_request_metrics_snapshot_and_report():
+    metrics = RequestMetrics()
+    metrics.record("CompletionsReq", SEND, 0.002)
+    metrics.record("CompletionInfoList", HANDLER, 0.010)
+    metrics.count("CompletionsReq", TIMEOUTS)
+    metrics.count(None, TIMEOUTS)
+
+    snapshot = metrics.snapshot()
+    assert snapshot["CompletionsReq"][SEND]["count"] == 1
+    assert snapshot["CompletionsReq"][SEND]["p99"] == pytest.approx(2.0, rel=1.0 / 16)
+    assert snapshot["CompletionsReq"][TIMEOUTS] == 1
+    assert snapshot["unknown"][TIMEOUTS] == 1
+
+    report = metrics.report()
+    assert "CompletionInfoList" in report and "1 timeouts" in report
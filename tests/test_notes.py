@@ -0,0 +1,139 @@
+# coding: utf-8
+
+import threading
+
+from notes import Note, NotesStorage, FileNotes, WARN
+
+
+def note(start, end, line, severity="NoteError", file="/src/A.scala"):
+    return Note({"msg": "m{}".format(start), "file": file, "severity": {"typehint": severity},
+                 "beg": start, "end": end, "line": line, "col": 1})
+
+
+def starts(notes):
+    return [n.start for n in notes]
+
+
+def test_in_offset_order_whatever_the_arrival():
+    notes = FileNotes()
+    notes.extend([note(50, 55, 5), note(10, 12, 1)])
+    notes.append(note(30, 31, 3))
+    assert len(notes) == 3
+    assert starts(notes) == [10, 30, 50]
+
+
+def test_in_region():
+    notes = FileNotes()
+    notes.extend([note(0, 100, 1), note(10, 12, 1), note(20, 20, 2), note(40, 45, 4)])
+    assert starts(notes.in_region(11, 15)) == [0, 10]
+    assert starts(notes.in_region(12, 20)) == [0]
+    # empty notes and regions count as one character
+    assert starts(notes.in_region(20, 20)) == [0, 20]
+    assert starts(notes.in_region(101, 200)) == []
+    assert starts(notes.in_region(44, 1000)) == [0, 40]
+
+
+def test_on_lines():
+    notes = FileNotes()
+    notes.extend([note(i * 10, i * 10 + 5, i) for i in range(1, 10)] + [note(92, 93, 9)])
+    assert starts(notes.on_lines(3, 4)) == [30, 40]
+    assert starts(notes.on_lines(9, 100)) == [90, 92]
+    assert notes.on_lines(20, 30) == []
+
+
+def test_by_severity_after_more_notes():
+    notes = FileNotes()
+    notes.extend([note(10, 11, 1, "NoteWarn"), note(20, 21, 2)])
+    assert starts(notes.by_severity("NoteWarn")) == [10]
+    notes.append(note(5, 6, 1, "NoteWarn"))
+    assert starts(notes.by_severity("NoteWarn")) == [5, 10]
+    assert notes.by_severity("NoteInfo") == []
+
+
+def test_storage_indexes_per_file(tmpdir):
+    a, b = tmpdir.join("A.scala").strpath, tmpdir.join("B.scala").strpath
+    storage = NotesStorage()
+    storage.append([note(1, 2, 1, file=a), note(3, 4, 1, file=b), note(0, 1, 1, file=a)])
+    assert starts(storage.for_file(a)) == [0, 1]
+    assert starts(storage.for_file(b).in_region(0, 10)) == [3]
+    storage.clear()
+    assert len(storage.for_file(a)) == 2
+    assert storage.swap()
+    assert len(storage.for_file(a)) == 0
+
+
+def test_generation_per_changed_file(tmpdir):
+    a, b = tmpdir.join("A.scala").strpath, tmpdir.join("B.scala").strpath
+    storage = NotesStorage()
+    assert storage.changed_since(0) == []
+    storage.append([note(1, 2, 1, file=a), note(3, 4, 1, file=b)])
+    assert sorted(storage.changed_since(0)) == sorted([storage.normalized_cache[a],
+                                                       storage.normalized_cache[b]])
+    rendered = storage.generation
+
+    # a full typecheck reporting the same notes again changes nothing
+    storage.clear()
+    storage.append([note(1, 2, 1, file=a), note(3, 4, 1, file=b)])
+    storage.swap()
+    assert storage.changed_since(rendered) == []
+
+    storage.clear()
+    storage.append([note(1, 2, 1, file=a), note(5, 6, 2, file=b)])
+    storage.swap()
+    assert storage.changed_since(rendered) == [storage.normalized_cache[b]]
+    rendered = storage.generation
+
+    # cleared notes are a change too
+    storage.clear()
+    storage.append([note(5, 6, 2, file=b)])
+    storage.swap()
+    assert storage.changed_since(rendered) == [storage.normalized_cache[a]]
+
+
+def test_notes_after_clear_wait_for_swap(tmpdir):
+    a = tmpdir.join("A.scala").strpath
+    storage = NotesStorage()
+    storage.append([note(1, 2, 1, file=a)])
+    assert len(storage.changed_since(0)) == 1
+    rendered = storage.generation
+
+    storage.clear()
+    storage.append([note(1, 2, 1, file=a), note(7, 8, 2, file=a)])
+    # the previous notes are still shown, nothing to redraw
+    assert starts(storage.for_file(a)) == [1]
+    assert storage.changed_since(rendered) == []
+    assert storage.swap()
+    assert not storage.swap()
+    assert starts(storage.for_file(a)) == [1, 7]
+    assert storage.changed_since(rendered) == [storage.normalized_cache[a]]
+
+    # without a clear, notes are shown as they come
+    storage.append([note(9, 10, 3, file=a)])
+    assert starts(storage.for_file(a)) == [1, 7, 9]
+
+
+def test_notes_share_file_names_and_severities():
+    # strings built at runtime, like those decoded from the server's messages
+    def message(msg, severity):
+        return {"msg": msg, "file": "".join(["/src/", "A.scala"]),
+                "severity": {"typehint": "".join(["Note", severity])},
+                "beg": 0, "end": 1, "line": 1, "col": 1}
+    first, second = Note(message("a", "Warn")), Note(message("b", "Warn"))
+    assert first.file_name is second.file_name
+    assert first.severity is second.severity is WARN
+    assert not hasattr(first, "__dict__")
+
+
+def test_notes_added_while_querying_are_kept():
+    notes = FileNotes()
+    added = [note(i, i + 1, i) for i in range(20000)]
+
+    def add():
+        for n in added:
+            notes.append(n)
+    writer = threading.Thread(target=add)
+    writer.start()
+    while writer.is_alive():
+        notes.by_severity("NoteError")
+    writer.join()
+    assert len(notes.by_severity("NoteError")) == len(added)
@@ -0,0 +1,60 @@
+# coding: utf-8
+
+import pytest
+
+from recorder import TrafficRecorder, read_recording, recording_path, replay, INBOUND, OUTBOUND
+
+
+def record(path, frames):
+    recorder = TrafficRecorder(path)
+    for direction, frame in frames:
+        if direction == INBOUND:
+            recorder.inbound(frame)
+        else:
+            recorder.outbound(frame)
+    recorder.close()
+
+
+def test_records_frames_verbatim(tmpdir):
+    path = recording_path(str(tmpdir), now=0)
+    frames = [(OUTBOUND, '{"callId":1,"req":{"typehint":"ConnectionInfoReq"}}'),
+              (INBOUND, '{"callId":1,"payload":{"typehint":"ConnectionInfo","version":"é"}}')]
+    record(path, frames)
+    record(path, frames[1:])  # a second session appends
+
+    entries = list(read_recording(path))
+    assert [(d, f) for _, d, f in entries] == frames + frames[1:]
+    assert all(offset >= 0 for offset, _, _ in entries)
+
+
+def test_replay_feeds_inbound_payloads(tmpdir):
+    path = str(tmpdir.join("traffic.log"))
+    with open(path, "w") as f:
+        f.write('{"version":1,"started":0}\n'
+                '[0.0,">","{\\"callId\\":1,\\"req\\":{}}"]\n'
+                '[1.0,"<","{\\"callId\\":1,\\"payload\\":{\\"typehint\\":\\"A\\"}}"]\n'
+                '[3.0,"<","{\\"payload\\":{\\"typehint\\":\\"B\\"}}"]\n')
+    handled, slept = [], []
+    assert replay(path, lambda call_id, payload: handled.append((call_id, payload["typehint"])),
+                  speed=4, sleep=slept.append) == 2
+    assert handled == [(1, "A"), (None, "B")]
+    assert slept == [pytest.approx(0.5)]
+
+    slept[:] = []
+    replay(path, lambda call_id, payload: None, speed=0, sleep=slept.append)
+    assert slept == []
+
+
+def test_replay_goes_on_after_a_failing_handler(tmpdir):
+    path = str(tmpdir.join("traffic.log"))
+    with open(path, "w") as f:
+        f.write('[0.0,"<","{\\"callId\\":7,\\"payload\\":{\\"typehint\\":\\"ImportSuggestions\\"}}"]\n'
+                '[0.0,"<","{\\"payload\\":{\\"typehint\\":\\"B\\"}}"]\n')
+    handled = []
+
+    def handle(call_id, payload):
+        if call_id is not None:
+            raise KeyError(call_id)
+        handled.append(payload["typehint"])
+    assert replay(path, handle, speed=0) == 2
+    assert handled == ["B"]
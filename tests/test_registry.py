@@ -0,0 +1,53 @@
+# coding: utf-8
+
+import time
+
+import pytest
+
+from registry import RequestRegistry, SWEEP_INTERVAL
+
+
+def test_behaves_like_a_dict():
+    registry = RequestRegistry()
+    registry[1] = {'async': True}
+    assert 1 in registry
+    assert registry[1] == {'async': True}
+    assert registry.get(2) is None
+    del registry[1]
+    assert len(registry) == 0
+    assert registry.pop(1, None) is None
+    with pytest.raises(KeyError):
+        registry[1]
+
+
+def test_sweep_drops_expired_entries():
+    registry = RequestRegistry(ttl=10)
+    registry[1] = 'default ttl'
+    registry.put(2, 'short ttl', ttl=1)
+    registry.put(3, 'long ttl', ttl=100)
+    assert registry.sweep(now=time.time() + 5) == 1
+    assert registry.sweep(now=time.time() + 50) == 1
+    assert 3 in registry
+    assert registry.stats()['expired'] == 2
+
+
+def test_maybe_sweep_waits_for_the_interval():
+    registry = RequestRegistry(ttl=0)
+    registry[1] = 'expired already'
+    assert registry.maybe_sweep() == 0
+    assert registry.maybe_sweep(now=time.time() + SWEEP_INTERVAL) == 1
+
+
+def test_size_cap_evicts_oldest():
+    registry = RequestRegistry(max_size=2)
+    for call_id in range(1, 5):
+        registry[call_id] = call_id
+    assert 1 not in registry and 2 not in registry
+    assert registry[3] == 3 and registry[4] == 4
+    assert registry.stats() == {'size': 2, 'expired': 0, 'evicted': 2, 'dropped_late': 0}
+
+
+def test_counts_late_responses():
+    registry = RequestRegistry()
+    registry.record_late()
+    assert registry.stats()['dropped_late'] == 1
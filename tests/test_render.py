@@ -0,0 +1,80 @@
+# coding: utf-8
+
+from render import RenderScheduler, RenderedViews
+
+
+def test_requests_are_coalesced_into_one_flush(timer):
+    scheduler = RenderScheduler(timer, interval=16)
+    rendered = []
+    for i in range(10):
+        scheduler.request("changed", lambda i=i: rendered.append(("changed", i)))
+    scheduler.request("all", lambda: rendered.append(("all", None)))
+    assert len(timer.callbacks) == 1
+    timer.fire()
+    # the latest render of each key, in the order keys were first requested
+    assert rendered == [("changed", 9), ("all", None)]
+    assert scheduler.stats() == {"requested": 11, "rendered": 2, "coalesced": 9, "cancelled": 0,
+                                 "flushes": 1}
+
+
+def test_next_request_arms_a_new_flush(timer):
+    scheduler = RenderScheduler(timer)
+    rendered = []
+    scheduler.request("changed", lambda: rendered.append(1))
+    timer.fire()
+    scheduler.request("changed", lambda: rendered.append(2))
+    assert len(timer.callbacks) == 1
+    timer.fire()
+    assert rendered == [1, 2]
+    assert scheduler.coalesced == 0
+
+
+def test_cancel_drops_pending_renders(timer):
+    scheduler = RenderScheduler(timer)
+    rendered = []
+    scheduler.request("changed", lambda: rendered.append(1))
+    scheduler.cancel()
+    timer.fire()
+    assert rendered == []
+    scheduler.request("changed", lambda: rendered.append(2))
+    timer.fire()
+    assert rendered == [2]
+    assert scheduler.stats()["cancelled"] == 1
+    assert scheduler.coalesced == 0
+
+
+class View(object):
+    def __init__(self, view_id, file_name):
+        self.view_id = view_id
+        self.file_name = file_name
+
+    def id(self):
+        return self.view_id
+
+
+def file_of(view):
+    return view.file_name
+
+
+def test_views_opened_after_a_redraw_are_drawn_once():
+    rendered = RenderedViews()
+    a, b = View(1, "/a.scala"), View(2, "/b.scala")
+    assert rendered.select([a, b], set(), file_of) == [a, b]
+    for view in (a, b):
+        rendered.rendered(view)
+    assert rendered.select([a, b], set(), file_of) == []
+    assert rendered.select([a, b], {"/b.scala"}, file_of) == [b]
+
+    # notes reported again identically, the clone is still drawn
+    clone, untitled = View(3, "/a.scala"), View(4, None)
+    assert rendered.select([a, b, clone, untitled], set(), file_of) == [clone]
+    rendered.rendered(clone)
+    assert rendered.drawn(clone)
+
+
+def test_closed_views_are_forgotten():
+    rendered = RenderedViews()
+    a = View(1, "/a.scala")
+    rendered.rendered(a)
+    rendered.select([], set(), file_of)
+    assert not rendered.drawn(a)
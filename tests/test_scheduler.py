@@ -0,0 +1,68 @@
+# coding: utf-8
+
+import pytest
+
+from scheduler import RequestScheduler, INTERACTIVE, BACKGROUND
+
+
+@pytest.fixture
+def sent():
+    return []
+
+
+@pytest.fixture
+def scheduler(sent):
+    return RequestScheduler(sent.append, max_background=1)
+
+
+def test_interactive_requests_are_sent_right_away(scheduler, sent):
+    scheduler.submit(1, "bg1", BACKGROUND)
+    scheduler.submit(2, "bg2", BACKGROUND)
+    scheduler.submit(3, "completions", INTERACTIVE)
+    assert sent == ["bg1", "completions"]
+    assert scheduler.queued(2)
+    assert not scheduler.queued(3)
+
+
+def test_background_requests_are_capped_and_sent_in_order(scheduler, sent):
+    scheduler.max_background = 2
+    for call_id in range(1, 6):
+        scheduler.submit(call_id, "bg{}".format(call_id), BACKGROUND)
+    assert sent == ["bg1", "bg2"]
+    scheduler.done(2)
+    assert sent == ["bg1", "bg2", "bg3"]
+    # unknown or repeated call IDs don't free slots
+    scheduler.done(2)
+    scheduler.done(42)
+    assert sent == ["bg1", "bg2", "bg3"]
+    scheduler.done(1)
+    scheduler.done(3)
+    assert sent == ["bg1", "bg2", "bg3", "bg4", "bg5"]
+
+
+def test_abandoned_request_is_never_sent(scheduler, sent):
+    scheduler.submit(1, "bg1", BACKGROUND)
+    scheduler.submit(2, "bg2", BACKGROUND)
+    scheduler.done(2)
+    scheduler.done(1)
+    assert sent == ["bg1"]
+    assert scheduler.stats()["background_waiting"] == 0
+
+
+def test_expired_slots_are_reclaimed(scheduler, sent):
+    scheduler.submit(1, "bg1", BACKGROUND, timeout=-1)
+    scheduler.submit(2, "bg2", BACKGROUND)
+    assert sent == ["bg1", "bg2"]
+    assert scheduler.stats()["background_expired"] == 1
+
+
+def test_queue_times_per_class(scheduler, sent):
+    scheduler.submit(1, "bg1", BACKGROUND)
+    scheduler.submit(2, "bg2", BACKGROUND)
+    scheduler.submit(3, "type", INTERACTIVE)
+    scheduler.done(1)
+    stats = scheduler.stats()
+    assert stats[INTERACTIVE]["count"] == 1
+    assert stats[BACKGROUND]["count"] == 2
+    assert stats["background_in_flight"] == 1
+    assert set(stats[BACKGROUND]) >= set(["p50", "p99", "max"])
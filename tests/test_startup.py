@@ -0,0 +1,69 @@
+# coding: utf-8
+
+import logging
+
+from startup import (StartupTimeline, wait_until_ready, accepts_connections,
+                     SPAWNED, PORT_WRITTEN, SOCKET_ACCEPTED, INDEXER_READY)
+
+
+class FakeProcess(object):
+    """Writes its port file after ``port_after`` reads, dies after ``alive`` checks."""
+
+    def __init__(self, port, port_after=0, alive=None):
+        self.port = port
+        self.port_after = port_after
+        self.alive = alive
+        self.reads = 0
+
+    def is_running(self):
+        if self.alive is None:
+            return True
+        self.alive -= 1
+        return self.alive >= 0
+
+    def http_port(self):
+        self.reads += 1
+        if self.reads <= self.port_after:
+            raise IOError("no such file")
+        return self.port
+
+
+def test_timeline_keeps_first_marks_in_order():
+    timeline = StartupTimeline(logging.getLogger("test"))
+    timeline.mark(SPAWNED, at=100.0)
+    timeline.mark(SOCKET_ACCEPTED, at=101.5)
+    timeline.mark(PORT_WRITTEN, at=101.0)
+    timeline.mark(PORT_WRITTEN, at=105.0)
+    timeline.mark(INDEXER_READY, at=110.0)
+    assert timeline.offsets() == {SPAWNED: 0.0, PORT_WRITTEN: 1.0, SOCKET_ACCEPTED: 1.5,
+                                  INDEXER_READY: 10.0}
+    assert timeline.summary() == ("process spawned +0.000s, port written +1.000s, "
+                                  "socket accepted +1.500s, IndexerReady +10.000s")
+
+
+def test_waits_for_port_file_with_growing_delays(listening_port):
+    process = FakeProcess(listening_port, port_after=4)
+    timeline = StartupTimeline(logging.getLogger("test"))
+    delays = []
+    assert wait_until_ready(process, 10, timeline, sleep=delays.append)
+    assert delays == [0.02, 0.04, 0.08, 0.16]
+    assert set(timeline.offsets()) == set([PORT_WRITTEN, SOCKET_ACCEPTED])
+
+
+def test_backoff_restarts_once_port_is_known(closed_port):
+    process = FakeProcess(closed_port, port_after=2, alive=5)
+    delays = []
+    assert not wait_until_ready(process, 10, StartupTimeline(logging.getLogger("test")),
+                                sleep=delays.append)
+    assert delays == [0.02, 0.04, 0.02, 0.04, 0.08]
+
+
+def test_gives_up_after_timeout(closed_port):
+    process = FakeProcess(closed_port, port_after=1000)
+    assert not wait_until_ready(process, 0, StartupTimeline(logging.getLogger("test")),
+                                sleep=lambda delay: None)
+
+
+def test_accepts_connections(listening_port, closed_port):
+    assert accepts_connections(listening_port)
+    assert not accepts_connections(closed_port)
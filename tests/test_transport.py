@@ -0,0 +1,77 @@
+# coding: utf-8
+
+import logging
+import threading
+import time
+
+import pytest
+import websocket
+
+from transport import ThreadedTransport
+from waiters import ResponseWaiters
+
+
+class BlockingWebSocket(object):
+    """Stands in for a websocket whose ``send`` blocks until released."""
+
+    def __init__(self, fail=False):
+        self.release = threading.Event()
+        self.sent = []
+        self.fail = fail
+
+    def send(self, msg):
+        self.release.wait(5)
+        if self.fail:
+            raise websocket.WebSocketConnectionClosedException("gone")
+        self.sent.append(msg)
+
+    def close(self, timeout=None):
+        pass
+
+
+@pytest.fixture
+def send_errors():
+    return []
+
+
+@pytest.fixture
+def transport(send_errors):
+    transport = ThreadedTransport(ResponseWaiters(), None, lambda msg: None,
+                                  lambda msg, e: send_errors.append((msg, e)),
+                                  logging.getLogger("test"))
+    yield transport
+    transport.ws = None
+    transport.close()
+
+
+def wait_for(predicate):
+    deadline = time.time() + 5
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_send_does_not_wait_for_the_socket(transport):
+    ws = BlockingWebSocket()
+    # bypass the poller: it only reads, the writer is what is being tested
+    transport.ws = ws
+    start = time.time()
+    for i in range(3):
+        transport.send("msg {}".format(i))
+    assert time.time() - start < 0.5
+    assert transport.stats()['queue_depth'] == 3
+
+    ws.release.set()
+    assert wait_for(lambda: transport.stats()['sent'] == 3)
+    assert ws.sent == ["msg 0", "msg 1", "msg 2"]
+    assert transport.stats()['queue_depth'] == 0
+
+
+def test_send_errors_are_reported_from_the_writer(transport, send_errors):
+    ws = BlockingWebSocket(fail=True)
+    ws.release.set()
+    transport.ws = ws
+    transport.send("lost")
+    assert wait_for(lambda: send_errors)
+    assert send_errors[0][0] == "lost"
+    assert transport.stats()['failed'] == 1
@@ -0,0 +1,55 @@
+# coding: utf-8
+
+from concurrent.futures import Future
+
+import pytest
+
+from typecheck import TypecheckScheduler
+
+
+@pytest.fixture
+def sent():
+    return []
+
+
+@pytest.fixture
+def scheduler(timer, sent):
+    def send(files):
+        future = Future()
+        sent.append((files, future))
+        return future
+    return TypecheckScheduler(send, timer, lambda: None)
+
+
+def test_batches_and_filters_files(scheduler, timer, sent):
+    scheduler.active_file = lambda: "/src/B.scala"
+    scheduler.add(["/src/A.scala", None, "/build.sbt"])
+    scheduler.add(["/src/B.scala", "/src/A.scala", "/src/C.java"])
+    assert len(timer.callbacks) == 1
+    timer.fire()
+    assert [files for files, _ in sent] == [["/src/B.scala", "/src/A.scala", "/src/C.java"]]
+
+
+def test_ignores_batches_without_sources(scheduler, timer):
+    scheduler.add([None, "/README.md"])
+    assert timer.callbacks == []
+
+
+def test_one_batch_in_flight(scheduler, timer, sent):
+    scheduler.add(["/src/A.scala"])
+    timer.fire()
+    scheduler.add(["/src/B.scala"])
+    scheduler.add(["/src/C.scala"])
+    assert timer.callbacks == []
+
+    sent[0][1].set_result({"typehint": "VoidResponse"})
+    timer.fire()
+    assert [files for files, _ in sent] == [["/src/A.scala"], ["/src/B.scala", "/src/C.scala"]]
+
+
+def test_released_when_not_sent(scheduler, timer):
+    scheduler.send = lambda files: None
+    scheduler.add(["/src/A.scala"])
+    timer.fire()
+    scheduler.add(["/src/B.scala"])
+    assert len(timer.callbacks) == 1
@@ -0,0 +1,146 @@
+# coding: utf-8
+
+import threading
+import time
+from concurrent.futures import TimeoutError
+
+import pytest
+
+from waiters import ResponseWaiters, RequestGenerations, Superseded
+
+
+def test_wait_returns_delivered_response():
+    waiters = ResponseWaiters()
+    waiters.expect(1)
+    assert waiters.deliver(1, {"payload": "pong"})
+    assert waiters.wait(1, timeout=1) == {"payload": "pong"}
+    assert 1 not in waiters
+
+
+def test_wait_wakes_up_on_delivery():
+    waiters = ResponseWaiters()
+    waiters.expect(7)
+    timer = threading.Timer(0.05, waiters.deliver, args=(7, "late enough"))
+    timer.start()
+    start = time.time()
+    assert waiters.wait(7, timeout=5) == "late enough"
+    assert time.time() - start < 1
+
+
+def test_wait_times_out():
+    waiters = ResponseWaiters()
+    waiters.expect(3)
+    assert waiters.wait(3, timeout=0.01) is None
+    assert len(waiters) == 0
+
+
+def test_late_response_is_refused():
+    waiters = ResponseWaiters()
+    waiters.expect(3)
+    waiters.wait(3, timeout=0.01)
+    assert not waiters.deliver(3, "too late")
+    assert not waiters.deliver(42, "never expected")
+
+
+def test_future_resolves_with_payload_and_runs_callbacks():
+    waiters = ResponseWaiters()
+    future = waiters.expect(5)
+    seen = []
+    future.add_done_callback(lambda f: seen.append(f.result()))
+    assert waiters.deliver(5, {"typehint": "SymbolInfo"})
+    assert future.result(timeout=0) == {"typehint": "SymbolInfo"}
+    assert seen == [{"typehint": "SymbolInfo"}]
+    assert not waiters.deliver(5, "twice")
+    waiters.discard(5)
+    assert 5 not in waiters
+
+
+def test_cancelled_future_refuses_delivery():
+    waiters = ResponseWaiters()
+    future = waiters.expect(5)
+    assert future.cancel()
+    assert 5 not in waiters
+    assert not waiters.deliver(5, "ignored")
+
+
+def test_expire_fails_overdue_futures():
+    waiters = ResponseWaiters()
+    overdue = waiters.expect(1, timeout=1)
+    pending = waiters.expect(2, timeout=10)
+    remaining = waiters.expire(now=time.time() + 5)
+    assert 4 < remaining <= 5
+    with pytest.raises(TimeoutError):
+        overdue.result(timeout=0)
+    assert not pending.done()
+    assert waiters.expire(now=time.time() + 60) is None
+    assert pending.exception(timeout=0).__class__ is TimeoutError
+
+
+class CountingWakeup(object):
+    def __init__(self):
+        self.count = 0
+
+    def wake(self):
+        self.count += 1
+
+
+def test_earlier_deadline_wakes_the_expiring_thread():
+    wakeup = CountingWakeup()
+    waiters = ResponseWaiters(wakeup)
+    waiters.expect(1, timeout=10)
+    waiters.expect(2, timeout=20)
+    waiters.expect(3)
+    assert wakeup.count == 1
+    waiters.expect(4, timeout=1)
+    assert wakeup.count == 2
+
+
+def test_clear_cancels_everything():
+    waiters = ResponseWaiters()
+    futures = [waiters.expect(i) for i in range(3)]
+    waiters.clear()
+    assert all(f.cancelled() for f in futures)
+    assert len(waiters) == 0
+
+
+def test_newer_request_supersedes_pending_one():
+    generations = RequestGenerations()
+    assert generations.begin("view-1", 1) is None
+    assert generations.begin("view-2", 2) is None
+    assert generations.begin("view-1", 3) == 1
+    assert generations.generation("view-1") == 2
+    assert not generations.end(1)
+    assert generations.end(2)
+    assert generations.end(3)
+
+
+def test_answered_request_is_not_superseded():
+    generations = RequestGenerations()
+    generations.begin("view", 1)
+    assert generations.end(1)
+    assert generations.begin("view", 2) is None
+    assert generations.end(2)
+    assert generations.end(99)
+
+
+def test_superseded_caller_wakes_with_its_own_outcome():
+    waiters = ResponseWaiters()
+    future = waiters.expect(1, timeout=5)
+    threading.Timer(0.05, waiters.supersede, args=(1,)).start()
+    start = time.time()
+    with pytest.raises(Superseded):
+        waiters.wait(1, timeout=5)
+    assert time.time() - start < 1
+    assert isinstance(future.exception(), Superseded)
+    assert not waiters.deliver(1, "too late")
+
+
+def test_obsolete_requests_are_bounded():
+    generations = RequestGenerations(max_size=2)
+    for call_id in range(1, 6):
+        generations.begin("view", call_id)
+    assert generations.stats()["evicted"] == 2
+    # forgotten, its late response is let through like any unknown one
+    assert generations.end(1)
+    assert not generations.end(4)
+
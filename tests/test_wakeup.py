@@ -0,0 +1,33 @@
+# coding: utf-8
+
+import select
+import threading
+import time
+
+from wakeup import Wakeup
+
+
+def test_wake_interrupts_select():
+    wakeup = Wakeup()
+    threading.Timer(0.05, wakeup.wake).start()
+    start = time.time()
+    readable, _, _ = select.select([wakeup], [], [], 5)
+    assert readable == [wakeup]
+    assert time.time() - start < 1
+    wakeup.close()
+
+
+def test_drain_rearms():
+    wakeup = Wakeup()
+    for _ in range(3):
+        wakeup.wake()
+    wakeup.drain()
+    readable, _, _ = select.select([wakeup], [], [], 0)
+    assert readable == []
+    wakeup.close()
+
+
+def test_wake_after_close_is_harmless():
+    wakeup = Wakeup()
+    wakeup.close()
+    wakeup.wake()